@@ -1,8 +1,41 @@
+import argparse
+from datetime import datetime
+
 import bot_functions    
 
 if __name__ == "__main__" :
+    parser = argparse.ArgumentParser(description='Uni timetable parser & formatter')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to handle .docx files in parallel')
+    parser.add_argument('--grab', action='store_true', help='download new / changed .docx files from site before handling')
+    parser.add_argument('--force', action='store_true', help='rebuild all files, even if they did not change since last run')
+    parser.add_argument('--week', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), help='generate week containing this date (YYYY-MM-DD) instead of current one, outputs are named <file>_<week start>')
+    parser.add_argument('--until', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), help='with --week: generate all weeks up to week containing this date (YYYY-MM-DD)')
+    parser.add_argument('--pages', action='store_true', help='with --week and --until: also save all weeks of each file as one multi-page PDF')
+    parser.add_argument('--per-group', action='store_true', help='also render picture for each group into res/pics/groups')
+    parser.add_argument('--per-day', action='store_true', help='with --per-group: also render picture for each day of each group')
+    parser.add_argument('--watch', action='store_true', help='keep running, polling for new / changed files')
+    parser.add_argument('--interval', type=int, default=600, help='with --watch: seconds between polls')
+    parser.add_argument('--jitter', type=int, default=60, help='with --watch: max random deviation of interval, seconds')
+    parser.add_argument('--pic-preset', choices=list(bot_functions.pic_presets), default='quality', help='pictures format: quality (antialiased PNG), speed / size (palette PNG), webp (lossless WebP)')
+    parser.add_argument('--prometheus', metavar='PATH', help='also write metrics of each run in Prometheus text format to PATH')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='also serve timetables over local HTTP API on PORT (keeps running after handling files)')
+    parser.add_argument('--host', default='127.0.0.1', help='with --serve: address to listen on')
+    args = parser.parse_args()
+    if (args.until or args.pages) and not args.week:
+        parser.error('--until and --pages require --week')
+    if args.until and args.until < args.week:
+        parser.error('--until must not be earlier than --week')
+    weeks = bot_functions.get_weeks(args.week, args.until or args.week) if args.week else None
+
     bot_functions.init_project_structure()
     bot_functions.log_options_init()
-    #a = bot_functions.grab_docx_files()
-    #print(a)
-    bot_functions.docxs_handler()
\ No newline at end of file
+    if args.watch:
+        if args.serve:
+            bot_functions.start_api(args.serve, args.host, args.pic_preset)
+        bot_functions.watch(args.interval, args.jitter, grab=args.grab, workers=args.workers, force=args.force, weeks=weeks, per_group=args.per_group, per_day=args.per_day, prometheus_path=args.prometheus, pic_preset=args.pic_preset, pages=args.pages)
+    else:
+        if args.grab:
+            bot_functions.grab_docx_files()
+        bot_functions.docxs_handler(workers=args.workers, force=args.force, weeks=weeks, per_group=args.per_group, per_day=args.per_day, prometheus_path=args.prometheus, pic_preset=args.pic_preset, pages=args.pages)
+        if args.serve:
+            bot_functions.start_api(args.serve, args.host, args.pic_preset, background=False)
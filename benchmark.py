@@ -0,0 +1,231 @@
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime, timedelta
+
+import bot_functions
+
+stages = ["parse", "headers", "fetch", "clean", "shorten", "layout", "draw", "save"]
+substages = {"headers": "fetch", "clean": "fetch", "shorten": "fetch", "layout": "draw"} # measured separately, but also part of stage, not counted in total
+default_baseline_path = './bench_baseline.json'
+day_names = ["ПОНЕДІЛОК ", "ВІВТОРОК ", "СЕРЕДА", "ЧЕТВЕР", "П’ЯТНИЦЯ", "СУБОТА"]
+time_slots = ["8.30-9.50", "10.00-11.20", "11.30-12.50", "13.10-14.30", "14.40-16.00", "16.10-17.30", "17.40-19.00", "19.10-20.30"]
+colors = ["000000", "000000", "000000", "FF0000", "0070C0"]
+noise = ["л.", "пр.", "ст.викл.Іваненко І.І.", "доц.Петренко П.П.", "Google meet", "парний тиждень", "10/18"]
+
+
+def make_synthetic_docx(weeks=4, groups=3, rows=7, seed=0, first_week=datetime(2022, 9, 5)):
+    """
+    Generates `.docx` (bytes) which looks like university timetable: one table per week,
+    with columns День, Час and `groups` groups, 6 days of `rows` time slots each.
+    Subjects are random names from `bot_functions.abbreviations` plus noise (teachers, links, etc.).
+
+    Returns:
+        bytes: content of `.docx` file.
+    """
+    rnd = random.Random(seed)
+    subjects = list(bot_functions.abbreviations) + ["Предмет "+str(i) for i in range(50)]
+    w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+    def paragraph(text, color=None):
+        color_xml = '<w:rPr><w:color w:val="'+color+'"/></w:rPr>' if color else ''
+        return '<w:p w:rsidR="00A1"><w:r>'+color_xml+'<w:t xml:space="preserve">'+text+'</w:t></w:r></w:p>'
+
+    def cell(*paragraphs):
+        return '<w:tc><w:tcPr/>'+(''.join(paragraphs) or '<w:p w:rsidR="00A1"/>')+'</w:tc>'
+
+    body = []
+    for week in range(weeks):
+        week_start = first_week + timedelta(days=7*week)
+        table_rows = ['<w:tr>'+cell(paragraph("День"))+cell(paragraph("Час"))+''.join(cell(paragraph("С-"+str(11+g))) for g in range(groups))+'</w:tr>']
+        for day_id, day in enumerate(day_names):
+            for slot in range(rows):
+                day_cell = cell(paragraph(day), paragraph((week_start + timedelta(days=day_id)).strftime('%d.%m.%yр.'))) if slot == 0 else cell()
+                subject_cells = []
+                for g in range(groups):
+                    if rnd.random() < 0.5:
+                        text = rnd.choice(subjects)+", "+", ".join(rnd.sample(noise, 2))
+                        subject_cells.append(cell(paragraph(text, rnd.choice(colors))))
+                    else:
+                        subject_cells.append(cell())
+                table_rows.append('<w:tr>'+day_cell+cell(paragraph(time_slots[slot % len(time_slots)]))+''.join(subject_cells)+'</w:tr>')
+        body.append('<w:tbl><w:tblPr/>'+''.join(table_rows)+'</w:tbl>'+paragraph(""))
+    document = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:document '+w+'><w:body>'+''.join(body)+'</w:body></w:document>'
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zip:
+        zip.writestr('word/document.xml', document)
+    return output.getvalue()
+
+
+def load_corpus(path='./res/docx'):
+    """
+    Returns list of (file name, content) of `.docx` files from `path`.
+    """
+    corpus = []
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.startswith('~'):
+            with open(os.path.join(path, file_name), 'rb') as f:
+                corpus.append((file_name, f.read()))
+    return corpus
+
+
+def get_latest_week(content):
+    """
+    Returns start of the latest week having table in `.docx` `content` (None if there is no such week),
+    found outside of timed stages, so "parse" stage can look up requested week like `docx_handler` does.
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as zip:
+        with zip.open('word/document.xml') as document:
+            week_index = bot_functions.get_week_index(bot_functions.parse_document(document))
+    return max(week_index) if week_index else None
+
+
+def run_pipeline(file_name, content, week_start, measure, pic_preset="quality"):
+    """
+    Runs pipeline stages for one `.docx` and week `week_start` (see `get_latest_week`), each stage wrapped by
+    `measure(stage, func, *args)`. "parse" is `bot_functions.parse_weeks`, the same memory-bounded path as in `docx_handler`.
+    Picture is drawn and saved (in memory) according to `pic_preset`, see `bot_functions.pic_presets`.
+    """
+    if week_start is None:
+        return
+    with zipfile.ZipFile(io.BytesIO(content)) as zip:
+        with zip.open('word/document.xml') as document:
+            week_index = measure("parse", bot_functions.parse_weeks, document, [week_start], week_start)
+    table = week_index[week_start]
+    file_name = file_name.split('.')[0]
+    column_headers = measure("headers", bot_functions.get_column_headers, table, file_name)
+
+    texts = [p.text for row in table.rows[1:] for cell in row.cells[2:2+len(column_headers)] for p in cell.paragraphs]
+    cleaned = measure("clean", bot_functions.str_cleaner, texts)
+    measure("shorten", lambda: [bot_functions.shorten_text(text) for text in cleaned if text])
+    json_data = measure("fetch", bot_functions.fetch_schedule_data, table, file_name)
+
+    measure("layout", bot_functions.build_layout, json_data)
+    preset = bot_functions.pic_presets[pic_preset]
+    img = measure("draw", bot_functions.draw_timetable, json_data, week_start, preset["mode"])
+    measure("save", img.save, io.BytesIO(), format=preset["format"], **preset["params"])
+
+
+def clear_caches():
+    for func in (bot_functions.text_bbox, bot_functions.shorten_text, bot_functions.classify_state, bot_functions.resolve_column,
+                 bot_functions.canonical_group, bot_functions.parse_file_name, bot_functions.is_discipline_header):
+        func.cache_clear()
+
+
+def bench(corpus, repeat=3, pic_preset="quality"):
+    """
+    Times every stage over whole `corpus` (best of `repeat` runs), then measures peak memory of every stage
+    in separate run under `tracemalloc`. Caches are cleared before every stage, so stage is not sped up
+    by caches filled by previous one (e.g. "shorten" before "fetch", "layout" before "draw").
+
+    Returns:
+        dict: {stage: {"seconds", "files_per_sec", "peak_kb"}} and "total" of stages which are not `substages`.
+    """
+    corpus = [(file_name, content, get_latest_week(content)) for file_name, content in corpus]
+    best = {}
+    for _ in range(repeat):
+        times = dict.fromkeys(stages, 0.0)
+
+        def measure(stage, func, *args, **kwargs):
+            clear_caches()
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            times[stage] = times[stage] + time.perf_counter() - start
+            return result
+        for file_name, content, week_start in corpus:
+            run_pipeline(file_name, content, week_start, measure, pic_preset)
+        for stage in stages:
+            best[stage] = min(best.get(stage, float('inf')), times[stage])
+
+    peaks = dict.fromkeys(stages, 0)
+    tracemalloc.start()
+
+    def measure_memory(stage, func, *args, **kwargs):
+        clear_caches()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = func(*args, **kwargs)
+        peaks[stage] = max(peaks[stage], tracemalloc.get_traced_memory()[1] - base)
+        return result
+    for file_name, content, week_start in corpus:
+        run_pipeline(file_name, content, week_start, measure_memory, pic_preset)
+    tracemalloc.stop()
+
+    report = {}
+    for stage in stages:
+        report[stage] = {
+            "seconds": round(best[stage], 4),
+            "files_per_sec": round(len(corpus)/best[stage], 1) if best[stage] else None,
+            "peak_kb": round(peaks[stage]/1024),
+        }
+    total = sum(best[stage] for stage in stages if stage not in substages)
+    report["total"] = {"seconds": round(total, 4), "files_per_sec": round(len(corpus)/total, 1) if total else None,
+                       "peak_kb": max(report[stage]["peak_kb"] for stage in stages)}
+    return report
+
+
+def check_regressions(report, baseline, tolerance):
+    """
+    Returns list of stages slower than in `baseline` by more than `tolerance` (0.2 = 20%).
+    """
+    regressions = []
+    for stage in report:
+        if stage in baseline and report[stage]["seconds"] > baseline[stage]["seconds"]*(1+tolerance) + 0.001:
+            regressions.append(stage+": "+str(baseline[stage]["seconds"])+"s -> "+str(report[stage]["seconds"])+"s")
+    return regressions
+
+
+if __name__ == "__main__" :
+    parser = argparse.ArgumentParser(description='Benchmark of parse & render pipeline stages')
+    parser.add_argument('--synthetic', action='store_true', help='benchmark generated files instead of res/docx')
+    parser.add_argument('--files', type=int, default=10, help='with --synthetic: number of generated files')
+    parser.add_argument('--weeks', type=int, default=8, help='with --synthetic: weeks (tables) per file')
+    parser.add_argument('--groups', type=int, default=4, help='with --synthetic: groups (columns) per table')
+    parser.add_argument('--rows', type=int, default=7, help='with --synthetic: time slots per day')
+    parser.add_argument('--pic-preset', choices=list(bot_functions.pic_presets), default='quality', help='pictures format, see app.py')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs, best one is reported')
+    parser.add_argument('--baseline', default=default_baseline_path, help='path of stored baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='store results as new baseline')
+    parser.add_argument('--check', action='store_true', help='fail if any stage is slower than baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='with --check: allowed slowdown, 0.2 = 20%%')
+    parser.add_argument('--memory-limit', type=int, help='fail if peak memory of any stage for one file exceeds this, KB')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        corpus = [("synthetic"+str(i)+".docx", make_synthetic_docx(args.weeks, args.groups, args.rows, seed=i)) for i in range(args.files)]
+    else:
+        corpus = load_corpus()
+    report = bench(corpus, args.repeat, args.pic_preset)
+
+    print("%-11s %10s %12s %10s" % ("stage", "seconds", "files/sec", "peak KB"))
+    for stage in report:
+        print("%-11s %10s %12s %10s" % (("  " if stage in substages else "")+stage, report[stage]["seconds"], report[stage]["files_per_sec"], report[stage]["peak_kb"]))
+
+    key = "synthetic %dx%dx%dx%d" % (args.files, args.weeks, args.groups, args.rows) if args.synthetic else "res/docx"
+    if args.pic_preset != "quality":
+        key = key+" "+args.pic_preset
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding="utf-8") as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[key] = report
+        with open(args.baseline, 'w', encoding="utf-8") as f:
+            json.dump(baselines, f, indent=1, ensure_ascii=False)
+        print("baseline saved: "+args.baseline+" ["+key+"]")
+    if args.memory_limit and report["total"]["peak_kb"] > args.memory_limit:
+        sys.exit("peak memory "+str(report["total"]["peak_kb"])+" KB exceeds limit of "+str(args.memory_limit)+" KB")
+    if args.check:
+        if key not in baselines:
+            sys.exit("no baseline for ["+key+"] in "+args.baseline)
+        regressions = check_regressions(report, baselines[key], args.tolerance)
+        if regressions:
+            sys.exit("regressions:\n"+"\n".join(regressions))
+        print("no regressions")
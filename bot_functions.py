@@ -4,11 +4,29 @@ import logging
 from logging.handlers import TimedRotatingFileHandler
 import re
 from datetime import datetime, date, timedelta
-import itertools
 from difflib import SequenceMatcher
+from functools import lru_cache
 import zipfile
+import tempfile
+import hashlib
+import sqlite3
+import queue
+import random
+import threading
+import io
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, unquote
+from time import perf_counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import NamedTuple, Tuple
+from enum import IntFlag
+import xml.etree.ElementTree as ET
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import dpath.util
 from PIL import Image, ImageFont, ImageDraw
@@ -27,280 +45,1863 @@ clr_black = (0, 0, 0)
 clr_gray = (191, 191, 191)
 clr_red = (255, 0, 0)
 clr_blue = (0, 255, 0)
+clr_dark_blue = (0, 112, 192)
 font_18 = ImageFont.truetype("./res/arial.ttf", 18)
 font_21 = ImageFont.truetype("./res/arial.ttf", 21)
+date_full_re = re.compile(r"\d{2}.\d{2}.\d{2}")            # 12.09.22р.
+date_dot_full_re = re.compile(r".\d{2}.\d{2}.\d{2}")       # .12.09.22р.
+date_short_dot_re = re.compile(r"\d{2}.\d{2}.")            # 12.09.
+date_short_re = re.compile(r"\d{2}.\d{2}")                 # 12.09
+students_count_re = re.compile(r"\([^)]*\)")                # (123 students) in column header
+group_re = re.compile(r"^([А-ЩЬЮЯҐЄІЇа-щьюяґєії]{1,6})-?(\d{1,3})$")   # К-91, Ік-11, І21
+group_letters_re = re.compile(r"^[А-ЩЬЮЯҐЄІЇа-щьюяґєії]{1,6}$")          # Ік (number is in file name)
+group_number_re = re.compile(r"^\d{1,3}$")                              # 93 (letters from previous group or file name)
+file_letters_re = re.compile(r"[А-ЩЬЮЯҐЄІЇа-щьюяґєії]+")
+file_numbers_re = re.compile(r"\d+")
+latin_lookalikes = str.maketrans("ACEIKMHOPTXaceiopxy", "АСЕІКМНОРТХасеіорху") # Latin letters typed instead of Cyrillic in group names
+measure_draw = ImageDraw.Draw(Image.new("RGB", (0,0))) # used only to measure text, see `text_bbox`
 padding_px = 20 #sum of left \ right content padding
+pic_presets = { # output of pictures, see `save_pic`; params are passed to `Image.save` (e.g. zlib `compress_level` / `compress_type`)
+    "quality": {"mode": "RGB", "format": "PNG", "params": {"compress_level": 6}},     # antialiased text, biggest & slowest to save
+    "speed": {"mode": "P", "format": "PNG", "params": {"compress_level": 1}},       # palette image, ~15x faster to save, ~3x smaller
+    "size": {"mode": "P", "format": "PNG", "params": {"compress_level": 9}},        # palette image, ~6x smaller
+    "webp": {"mode": "P", "format": "WEBP", "params": {"lossless": True, "quality": 100, "method": 4}}, # lossless WebP, ~10x smaller
+}
+pic_palette = [c for color in (clr_dark_green, clr_light_green, clr_white, clr_black, clr_gray, clr_red, clr_dark_blue) for c in color] # all colors of timetable, for "P" mode
 row_height=25 # px
+cleaning_rules_path = './res/cleaning_rules.json' # see `load_cleaning_rules`
+abbreviations_path = './res/abbreviations.json' # see `shorten_text`
+parser_version = 2 # bump when parsing / cleaning changes JSON produced from the same docx
+manifest_path = './res/manifest.json' # incremental rebuild cache, see `docxs_handler`
+store_path = './res/timetable.db' # timetable store, see `open_store`
+store_schema = '''
+CREATE TABLE IF NOT EXISTS groups (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS subjects (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS lessons (
+    source TEXT NOT NULL,                           -- file name timetable comes from
+    week TEXT NOT NULL,                             -- week start, YYYY-MM-DD
+    group_id INTEGER NOT NULL REFERENCES groups(id),
+    day_id INTEGER NOT NULL,                        -- order of day in table
+    day TEXT NOT NULL,
+    time_id INTEGER NOT NULL,                       -- order of time slot in day
+    time TEXT NOT NULL,
+    subject_id INTEGER NOT NULL REFERENCES subjects(id),
+    type TEXT NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lessons_by_group ON lessons (group_id, week, day_id, time_id);
+CREATE INDEX IF NOT EXISTS lessons_by_week ON lessons (week, day, time);
+CREATE INDEX IF NOT EXISTS lessons_by_source ON lessons (source, week);
+CREATE TABLE IF NOT EXISTS changes (                -- change log, see `store_schedule`
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    detected_at TEXT NOT NULL,
+    source TEXT NOT NULL,
+    week TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    time TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    kind TEXT NOT NULL,                             -- added / removed / type / state
+    old TEXT,
+    new TEXT
+);
+CREATE INDEX IF NOT EXISTS changes_by_group ON changes (group_name, id);
+CREATE INDEX IF NOT EXISTS changes_by_week ON changes (week, id);
+CREATE TABLE IF NOT EXISTS renders (name TEXT PRIMARY KEY, fingerprint TEXT NOT NULL); -- see `render_pics`
+'''
+download_cache_path = './res/download_cache.json' # ETag / Last-Modified of downloaded files, see `grab_docx_files`
+request_timeout = 30 # sec
+group_registry_path = './res/group_registry.json' # groups of columns of each file, see `update_group_registry`
+headers_report = {} # column headers resolved by `init_json` in file handled by this process, see `resolve_column`
+watch_state_path = './res/watch_state.json' # health state of `watch` daemon
+watch_state = {}
+users_db_path = './res/users_db' # subscribers `{user id: {"groups": [group names], ...}}`, see `load_users`
+users_journal_path = './res/users_db.journal' # batches of subscription changes not yet compacted into `users_db_path`
+users_journal_limit = 1000 # changes in journal after which it is compacted
+users = {} # loaded users db, see `load_users`
+group_subscribers = {} # index: group name -> set of subscribed user ids
+users_journal_size = None # changes in journal, None - users db is not loaded yet
+users_lock = threading.RLock()
+metrics_path = './logs/metrics.jsonl' # per-run summaries of `docxs_handler`, one JSON per line
+api_index = {} # timetables served by HTTP API: group -> {week "YYYY-MM-DD": (`{column: json_data[column]}`, fingerprint)}, see `load_api_index`
+api_index_mtime = None # mtime of manifest `api_index` was loaded for, None - not loaded
+api_cache = OrderedDict() # LRU of encoded responses: (group, week, day, format) -> (etag, body), see `get_api_payload`
+api_cache_size = 256
+api_pic_preset = "quality" # pictures format of HTTP API, see `start_api`
+api_metrics = {"requests": 0, "not_modified": 0, "cache_hits": 0, "cache_misses": 0, "render_seconds": 0.0, "reloads": 0} # see `count_api`
+api_lock = threading.RLock()
+metrics = {"timings": {}, "counters": {}} # stage timings / counters of file handled by this process, see `timed`, `count`
+w_ns = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}' # WordprocessingML namespace of document.xml tags
+w_body, w_tbl, w_tr, w_tc, w_p, w_r, w_t = (w_ns+tag for tag in ('body', 'tbl', 'tr', 'tc', 'p', 'r', 't'))
+w_rpr, w_ppr_rpr = w_ns+'rPr', w_ns+'pPr/'+w_ns+'rPr'  # run properties, relative to `<w:r>` / paragraph mark properties, relative to `<w:p>`
+w_color, w_strike, w_dstrike, w_highlight, w_val = (w_ns+tag for tag in ('color', 'strike', 'dstrike', 'highlight', 'val'))
+
+
+class RunFormat(IntFlag):
+    """
+    Formatting of text run which has meaning in timetables, captured once while parsing (see `_get_format`).
+    """
+    NONE = 0
+    RED = 1         # font color, see `format_colors`
+    BLUE = 2
+    STRIKE = 4      # `<w:strike>` / `<w:dstrike>`
+    HIGHLIGHT = 8   # `<w:highlight>`
+
+
+format_colors = {"FF0000": RunFormat.RED, "0070C0": RunFormat.BLUE} # font colors (`<w:color w:val>`) -> RunFormat
+type_rules = (("л.", "lecture"), ("пр.", "practice")) # (marker in paragraph text, lesson type), first matching wins, else "?"
+state_rules = ((RunFormat.RED, "#FF0000"), (RunFormat.BLUE, "#0070C0")) # (format of paragraph, lesson state), first matching wins, else "#000000"
+state_styles = { # lesson state -> (priority, lower is drawn when slot has several lessons; text color; strike line), see `resolve_slots`
+    "#0070C0": (0, clr_dark_blue, False),
+    "#000000": (1, clr_black, False),
+    "#FF0000": (2, clr_red, True),
+}
+
+
+class Run(NamedTuple):
+    """
+    Text run `<w:r>` of paragraph: its text and formatting (`RunFormat` flags).
+    """
+    text: str
+    format: int = RunFormat.NONE
+
+
+class Paragraph(NamedTuple):
+    """
+    Paragraph `<w:p>` of cell, made of runs. `mark_format` - formatting of paragraph mark (`<w:pPr><w:rPr>`).
+    """
+    runs: Tuple[Run, ...]
+    mark_format: int = RunFormat.NONE
+
+    @property
+    def text(self):
+        return ''.join(run.text for run in self.runs)
+
+    @property
+    def format(self):
+        """
+        `RunFormat` flags used anywhere in paragraph (runs + paragraph mark).
+        """
+        paragraph_format = self.mark_format
+        for run in self.runs:
+            paragraph_format |= run.format
+        return paragraph_format
+
+
+class Cell(NamedTuple):
+    """
+    Table cell `<w:tc>`.
+    """
+    paragraphs: Tuple[Paragraph, ...]
+
+    @property
+    def text(self):
+        return ' '.join(p.text for p in self.paragraphs)
+
+
+class Row(NamedTuple):
+    """
+    Table row `<w:tr>`.
+    """
+    cells: Tuple[Cell, ...]
+
+
+class Table(NamedTuple):
+    """
+    Table `<w:tbl>` of document.
+    """
+    rows: Tuple[Row, ...]
 
 
 def init_project_structure():
     """
-    Init project directory structure
+    Init project directory structure
+    """
+    if not os.path.exists("./logs"):        os.makedirs("./logs")
+    if not os.path.exists("./res"):         os.makedirs("./res")
+    if not os.path.exists("./res/docx"):    os.makedirs("./res/docx")
+    if not os.path.exists("./res/pics"):    os.makedirs("./res/pics")
+    if not os.path.exists("./res/pics/groups"):    os.makedirs("./res/pics/groups")
+    if not os.path.exists('./res/json'):    os.makedirs("./res/json")
+    if not os.path.exists(users_db_path):   
+        with open(users_db_path, 'w', encoding="utf-8") as f: 
+            json.dump({}, f, indent=1, ensure_ascii=False)
+        f.close()
+
+
+def log_options_init():    
+    """
+    Initializes the logging options
+    """
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter(fmt='%(asctime)s %(levelname)s %(message)s',datefmt='%m-%d-%y %H:%M:%S')
+    fh = TimedRotatingFileHandler('./logs/log', when='midnight')
+    fh.setFormatter(formatter)
+    logger.addHandler(fh)
+    logger.info('> log options initialized')
+
+
+def grab_docx_files(base_url=None, password=None, workers=8, download=True, session=None):
+    """
+    Downloads docx files going through site and store files to `./res/docx`.
+    Directory pages and files are fetched concurrently in pool of `workers` threads over one pooled session.
+    Files are downloaded with conditional requests (ETag / Last-Modified from `download_cache_path`),
+    so unchanged files are not downloaded again, and streamed to disk atomically.
+
+    Args:
+        base_url (str): site url, `mntu_base_url` by default
+        password (str): site password, `mntu_password` by default
+        workers (int): max number of concurrent requests
+        download (bool): download found `.docx` files, or only build map of site
+        session (requests.Session): session to reuse (e.g. kept warm by `watch`), new one from `get_session` by default
+
+    Returns:
+        dict: dictionary containing the paths of `.docx` files found on the website.
+    """
+    json_data={}
+    logger.info('call grab_docx_files()')
+    base_url = base_url or mntu_base_url
+    mntu_start_url = base_url+'index.php?p=30&id_f=114'
+    s = session or get_session(pool_size=workers)
+    s.get(mntu_start_url, timeout=request_timeout) # GET request to site
+    s.post(mntu_start_url, data={'password_lib': password or mntu_password}, timeout=request_timeout) # login to site.
+
+    download_cache = load_download_cache()
+    downloaded = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(get_site_dir, s, mntu_start_url): ("dir", "")}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    logger.exception('grab_docx_files failed to get %s', key)
+                    continue
+                if kind == "file":
+                    download_cache[key], is_downloaded = result
+                    if is_downloaded:
+                        downloaded.append(key)
+                    continue
+
+                for file_name, file_href in result:
+                    temp_path_in_file=key+'/'+file_name  # header dir name
+                    print('['+file_name+']')
+                    if ".docx" in file_name:
+                        dpath.util.new(json_data, temp_path_in_file, 'null' )
+                        if download:
+                            file_url = base_url + file_href
+                            future = executor.submit(download_file, s, file_url, './res/docx/'+file_name+'.docx', download_cache.get(file_url))
+                            pending[future] = ("file", file_url)
+                    elif ".doc" in file_name:
+                        pass
+                    else:
+                        if "викладачі" not in file_name.lower():
+                            dpath.util.new(json_data, temp_path_in_file, {})
+                            pending[executor.submit(get_site_dir, s, base_url+file_href)] = ("dir", temp_path_in_file)
+
+    if download:
+        with atomic_open(download_cache_path, 'w', encoding="utf-8") as f:
+            json.dump(download_cache, f, indent=1, ensure_ascii=False)
+    logger.info('grab_docx_files done: %d files downloaded', len(downloaded))
+    return json_data
+
+
+def get_session(pool_size=8):
+    """
+    Creates `requests.Session` with connection pool of `pool_size` connections per host,
+    which retries failed GET requests with exponential backoff.
+    """
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    s = requests.Session()
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    return s
+
+
+def get_site_dir(s, url):
+    """
+    Fetches site directory page and returns its entries.
+
+    Returns:
+        list: list of `(name, href)` from rows of `forumline` table.
+    """
+    response = s.get(url, timeout=request_timeout)
+    response.raise_for_status()
+    trs = BeautifulSoup(response.content , "html.parser").find('table', {"class": "forumline"}).find_all('tr')[2:]
+    return [(tr.select_one('a').contents[0], tr.select_one('a')['href']) for tr in trs]
+
+
+def download_file(s, url, path, validators=None):
+    """
+    Downloads `url` into `path`, streaming body to disk.
+    If `validators` from previous download are given and `path` exists, sends conditional request
+    and leaves file as is on `304 Not Modified`.
+
+    Returns:
+        tuple: (validators dict `{"etag", "last_modified"}`, True if file was downloaded)
+    """
+    headers = {}
+    if validators and os.path.exists(path):
+        if validators.get("etag"):
+            headers['If-None-Match'] = validators["etag"]
+        if validators.get("last_modified"):
+            headers['If-Modified-Since'] = validators["last_modified"]
+
+    with s.get(url, headers=headers, stream=True, timeout=request_timeout) as response:
+        if response.status_code == 304:
+            return validators, False
+        response.raise_for_status()
+        with atomic_open(path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+        return {"etag": response.headers.get('ETag'), "last_modified": response.headers.get('Last-Modified')}, True
+
+
+def load_download_cache():
+    """
+    Loads `{file_url: {"etag", "last_modified"}}` saved by `grab_docx_files`.
+    """
+    try:
+        with open(download_cache_path, 'r', encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def docxs_handler(workers=1, force=False, weeks=None, per_group=False, per_day=False, files=None, prometheus_path=None, pic_preset="quality", pages=False, executor=None):
+    """
+    Docx driver handler, which extracts data / parse it on XML level and stack in json.
+    Every `.docx` file is independent, so with `workers` > 1 files are handled in process pool.
+    Each file is parsed once, for all requested weeks.
+
+    Outputs whose file content, week, parser version and render settings are the same as
+    on previous run (see `manifest_path`) and which still exist are not built again.
+    With several `weeks`, all weeks of file are built again if any of them is missing (or its multi-page PDF, with `pages`),
+    since weeks are drawn with layout measured over all of them, see `render_weeks`.
+
+    Args:
+        workers (int): number of processes to handle files in parallel (1 - handle in this process).
+        force (bool): rebuild all files, ignoring manifest.
+        weeks (list): week start dates (see `get_weeks`) to generate, outputs are named `<file>_<YYYY-MM-DD>`.
+            By default only week from `get_dates` is generated, outputs are named `<file>`.
+        per_group (bool): also render picture for each group into `./res/pics/groups`, see `render_groups`.
+        per_day (bool): with `per_group`, also render picture for each day of each group.
+        files (list): handle only these files from `./res/docx` (all by default).
+        prometheus_path (str): also write run metrics in Prometheus text format to this file, see `write_run_metrics`.
+        pic_preset (str): format / compression of pictures, one of `pic_presets`.
+        pages (bool): with several `weeks`, also save all weeks of file as one multi-page PDF, see `render_weeks`.
+        executor (ProcessPoolExecutor): already running pool to use instead of starting one for `workers`
+            (kept by `watch`, so caches of its processes stay warm between runs).
+
+    Returns:
+        dict: per-file results `{file_name: {"rendered": [output names], "error": str or None, "cached": bool}}`,
+            rebuilt files also have "metrics" (see `timed`, `count`).
+    """
+    logger.info('call docxs_handler')
+    run_start = perf_counter()
+    dir_content = files if files is not None else os.listdir('./res/docx')
+    docx_files = [x for x in dir_content if not x.startswith('~')] #exclude temp / open files
+    old_manifest = load_manifest()
+    manifest = {file_name: old_manifest[file_name] for file_name in old_manifest # keep entries of other existing files
+                if file_name not in docx_files and os.path.exists('./res/docx/'+file_name)}
+    results = {}
+    requested = {}
+    to_build = []
+    for file_name in docx_files:
+        old_entry = old_manifest.get(file_name)
+        entry = get_manifest_entry(file_name, old_entry, per_group, per_day, pic_preset)
+        if not force and is_same_input(entry, old_entry):
+            entry["outputs"] = dict(old_entry["outputs"])
+        manifest[file_name] = entry
+
+        outputs = requested[file_name] = get_outputs(file_name, weeks)
+        missing = {name: week for name, week in outputs.items() if not is_output_valid(name, week, entry["outputs"].get(name), pic_preset)}
+        rendered_weeks = [week for name, week in outputs.items() if name not in missing and entry["outputs"][name]["rendered"]]
+        if len(outputs) > 1 and (missing or pages and rendered_weeks and not os.path.exists("./res/pics/"+get_pages_name(file_name, rendered_weeks)+".pdf")):
+            missing = outputs # weeks share layout (and multi-page PDF), so they are always rendered together, see `render_weeks`
+        if missing:
+            to_build.append((file_name, missing))
+        else:
+            results[file_name] = {"rendered": [name for name in outputs if entry["outputs"][name]["rendered"]], "error": None, "cached": True}
+
+    options = {"per_group": per_group, "per_day": per_day, "force": force, "pic_preset": pic_preset, "pages": pages}
+    if executor and len(to_build) > 1:
+        for file_name, result in executor.map(_docx_handler_safe, [(file_name, outputs, options) for file_name, outputs in to_build]):
+            results[file_name] = result
+    elif workers > 1 and len(to_build) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for file_name, result in executor.map(_docx_handler_safe, [(file_name, outputs, options) for file_name, outputs in to_build]):
+                results[file_name] = result
+    else:
+        for file_name, outputs in to_build:
+            file_name, results[file_name] = _docx_handler_safe((file_name, outputs, options))
+
+    for file_name, outputs in to_build:
+        if results[file_name]["error"]:
+            del manifest[file_name] # retry on next run
+        else:
+            for name, week in outputs.items():
+                manifest[file_name]["outputs"][name] = {"week": week, "rendered": name in results[file_name]["rendered"]}
+            results[file_name]["rendered"] = [name for name in requested[file_name] if manifest[file_name]["outputs"][name]["rendered"]]
+    if manifest != old_manifest:
+        with atomic_open(manifest_path, 'w', encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, ensure_ascii=False)
+
+    update_group_registry(results, docx_files)
+
+    if api_index_mtime is not None: # HTTP API of this process serves new data right away
+        load_api_index()
+
+    failed = [file_name for file_name in results if results[file_name]["error"]]
+    logger.info('docxs_handler done: %d files, %d rebuilt, %d failed %s', len(results), len(to_build), len(failed), failed)
+    write_run_metrics(get_run_summary(results, perf_counter()-run_start), prometheus_path)
+    return results
+
+
+@contextmanager
+def timed(stage):
+    """
+    Adds time spent in `with timed(stage):` block to `metrics["timings"][stage]` (sec).
+    Stages may be nested, time of inner stage is included in outer one.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings = metrics["timings"]
+        timings[stage] = timings.get(stage, 0) + perf_counter() - start
+
+
+def count(counter, n=1):
+    """
+    Adds `n` to `metrics["counters"][counter]`.
+    """
+    counters = metrics["counters"]
+    counters[counter] = counters.get(counter, 0) + n
+
+
+def reset_metrics():
+    """
+    Starts collecting `metrics` of new file, returns metrics collected so far.
+    """
+    global metrics
+    collected, metrics = metrics, {"timings": {}, "counters": {}}
+    return collected
+
+
+def get_cache_counters(before, after, name):
+    """
+    Returns hit / miss counters of `lru_cache` between two `cache_info()` snapshots.
+    """
+    return {name+"_cache_hits": after.hits - before.hits, name+"_cache_misses": after.misses - before.misses}
+
+
+def get_run_summary(results, duration):
+    """
+    Builds summary of `docxs_handler` run: totals of stage timings / counters over rebuilt files and metrics of each of them.
+    """
+    timings = {}
+    counters = {}
+    files = {}
+    for file_name in results:
+        file_metrics = results[file_name].get("metrics")
+        if not file_metrics:
+            continue
+        for stage, seconds in file_metrics["timings"].items():
+            timings[stage] = timings.get(stage, 0) + seconds
+        for counter, n in file_metrics["counters"].items():
+            counters[counter] = counters.get(counter, 0) + n
+        files[file_name] = {
+            "seconds": round(file_metrics["seconds"], 4),
+            "error": results[file_name]["error"],
+            "timings": {stage: round(seconds, 4) for stage, seconds in file_metrics["timings"].items()},
+            "counters": file_metrics["counters"],
+        }
+    return {
+        "time": datetime.now().isoformat(timespec='seconds'),
+        "seconds": round(duration, 4),
+        "files": len(results),
+        "rebuilt": len(files),
+        "cached": sum(1 for file_name in results if results[file_name]["cached"]),
+        "failed": sum(1 for file_name in results if results[file_name]["error"]),
+        "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        "counters": counters,
+        "file_metrics": files,
+    }
+
+
+def write_run_metrics(summary, prometheus_path=None):
+    """
+    Appends run `summary` (see `get_run_summary`) as one JSON line to `metrics_path`, logs its totals and slowest file,
+    and, if `prometheus_path` is given, writes it there in Prometheus text format (for node_exporter textfile collector).
+    """
+    try:
+        os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+        with open(metrics_path, 'a', encoding="utf-8") as f:
+            f.write(json.dumps(summary, ensure_ascii=False)+"\n")
+    except OSError:
+        logger.exception('failed to write metrics')
+    logger.info('docxs_handler metrics: %.3fs, timings %s, counters %s', summary["seconds"], summary["timings"], summary["counters"])
+    if summary["file_metrics"]:
+        slowest = max(summary["file_metrics"], key=lambda file_name: summary["file_metrics"][file_name]["seconds"])
+        logger.info('slowest file: %s %.3fs %s', slowest, summary["file_metrics"][slowest]["seconds"], summary["file_metrics"][slowest]["timings"])
+
+    if prometheus_path:
+        lines = [
+            '# HELP timetable_run_seconds Duration of last docxs_handler run.',
+            '# TYPE timetable_run_seconds gauge',
+            'timetable_run_seconds '+str(summary["seconds"]),
+            '# HELP timetable_run_files Files of last run by result.',
+            '# TYPE timetable_run_files gauge',
+        ]
+        for result in ("files", "rebuilt", "cached", "failed"):
+            lines.append('timetable_run_files{result="'+result+'"} '+str(summary[result]))
+        lines += ['# HELP timetable_stage_seconds Time spent in pipeline stage during last run.', '# TYPE timetable_stage_seconds gauge']
+        lines += ['timetable_stage_seconds{stage="'+stage+'"} '+str(seconds) for stage, seconds in summary["timings"].items()]
+        lines += ['# HELP timetable_counter Counters of last run (regex calls, cache hits / misses, bytes read / written).', '# TYPE timetable_counter gauge']
+        lines += ['timetable_counter{name="'+counter+'"} '+str(n) for counter, n in summary["counters"].items()]
+        lines += ['# HELP timetable_file_seconds Time spent on file during last run.', '# TYPE timetable_file_seconds gauge']
+        for file_name, file_metrics in summary["file_metrics"].items():
+            label = file_name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append('timetable_file_seconds{file="'+label+'"} '+str(file_metrics["seconds"]))
+        try:
+            with atomic_open(prometheus_path, 'w', encoding="utf-8") as f:
+                f.write("\n".join(lines)+"\n")
+        except OSError:
+            logger.exception('failed to write prometheus metrics')
+
+
+def watch(interval=600, jitter=60, grab=False, workers=1, stop_event=None, **handler_options):
+    """
+    Resident mode: polls for new / changed `.docx` files every `interval` ± `jitter` seconds and handles them,
+    keeping fonts, compiled rules, HTTP session and caches of this process warm between polls.
+    Poll (optional `grab_docx_files` + scan of `./res/docx`) puts changed files into work queue,
+    which is handled by worker thread via `docxs_handler`. All files are queued again when week changes,
+    files whose handling failed are queued again on next poll.
+    With `workers` > 1 one process pool is kept for the whole time of watching.
+    State for health checks is kept in `watch_state` and written to `watch_state_path`.
+
+    Args:
+        interval (int): seconds between polls
+        jitter (int): max random deviation of interval, seconds
+        grab (bool): download files from site on each poll
+        workers (int): see `docxs_handler`
+        stop_event (threading.Event): set it to stop watching (runs forever by default)
+        handler_options: other `docxs_handler` arguments (force, weeks, per_group, per_day)
+    """
+    logger.info('call watch(interval=%s, jitter=%s, grab=%s)', interval, jitter, grab)
+    stop_event = stop_event or threading.Event()
+    work_queue = queue.Queue()
+    watch_state.update({"started_at": datetime.now().isoformat(timespec='seconds'), "pid": os.getpid(), "interval": interval})
+    seen = {}   # file name -> (size, mtime) when queued, failed files are removed by worker
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    worker = threading.Thread(target=_watch_worker, args=(work_queue, workers, handler_options, seen, executor), daemon=True)
+    worker.start()
+
+    session = get_session() if grab else None
+    seen_week = None
+    while not stop_event.is_set():
+        watch_state["last_poll"] = datetime.now().isoformat(timespec='seconds')
+        try:
+            if grab:
+                grab_docx_files(session=session)
+            week = get_dates()[1]
+            if week != seen_week:
+                seen.clear()
+                seen_week = week
+            changed = []
+            for file_name in os.listdir('./res/docx'):
+                if file_name.startswith('~'):
+                    continue
+                stat = os.stat('./res/docx/'+file_name)
+                if seen.get(file_name) != (stat.st_size, stat.st_mtime_ns):
+                    seen[file_name] = (stat.st_size, stat.st_mtime_ns)
+                    changed.append(file_name)
+            if changed:
+                work_queue.put(changed)
+            watch_state["polls"] = watch_state.get("polls", 0) + 1
+            watch_state["queued"] = work_queue.qsize()
+        except Exception as e:
+            logger.exception('watch poll failed')
+            watch_state["poll_errors"] = watch_state.get("poll_errors", 0) + 1
+            watch_state["last_error"] = repr(e)
+        save_watch_state()
+        stop_event.wait(max(0, interval + random.uniform(-jitter, jitter)))
+    work_queue.put(None)
+    worker.join()
+    if executor:
+        executor.shutdown()
+
+
+def _watch_worker(work_queue, workers, handler_options, seen, executor=None):
+    """
+    Handles batches of files from `watch` work queue until `None` is received.
+    Failed files are removed from `seen` of `watch`, so they are queued again on next poll.
+    """
+    stop = False
+    while not stop:
+        files = work_queue.get()
+        if files is None:
+            return
+        while not work_queue.empty(): # merge batches queued meanwhile
+            more = work_queue.get()
+            if more is None:
+                stop = True
+                break
+            files = files + [file_name for file_name in more if file_name not in files]
+        watch_state["busy"] = True
+        try:
+            results = docxs_handler(workers=workers, files=files, executor=executor, **handler_options)
+            watch_state["last_run"] = datetime.now().isoformat(timespec='seconds')
+            watch_state["last_run_files"] = len(files)
+            watch_state["last_run_failed"] = [file_name for file_name in results if results[file_name]["error"]]
+            for file_name in watch_state["last_run_failed"]:
+                seen.pop(file_name, None) # retry on next poll
+        except Exception as e:
+            logger.exception('watch worker failed')
+            watch_state["last_error"] = repr(e)
+            for file_name in files:
+                seen.pop(file_name, None)
+        watch_state["busy"] = False
+        watch_state["queued"] = work_queue.qsize()
+        save_watch_state()
+
+
+def save_watch_state():
+    """
+    Writes `watch_state` to `watch_state_path` (for health checks of `watch` process).
+    """
+    try:
+        with atomic_open(watch_state_path, 'w', encoding="utf-8") as f:
+            json.dump(watch_state, f, indent=1, ensure_ascii=False)
+    except OSError:
+        logger.exception('failed to save watch state')
+
+
+def get_outputs(file_name, weeks=None):
+    """
+    Returns outputs to generate from `.docx` file: `{output name: week start "YYYY-MM-DD"}`.
+    Output name is `<file>` for default week and `<file>_<YYYY-MM-DD>` for explicitly requested `weeks`.
+    """
+    file_name = file_name.split('.')[0]
+    if weeks is None:
+        return {file_name: get_dates()[1].strftime('%Y-%m-%d')}
+    return {file_name+'_'+week.strftime('%Y-%m-%d'): week.strftime('%Y-%m-%d') for week in weeks}
+
+
+def load_manifest():
+    """
+    Loads incremental rebuild manifest `{docx_file_name: entry}`, see `get_manifest_entry`.
+    Missing or broken manifest means "rebuild everything".
+    """
+    try:
+        with open(manifest_path, 'r', encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_manifest_entry(file_name, old_entry=None, per_group=False, per_day=False, pic_preset="quality"):
+    """
+    Builds manifest entry, describing inputs of pipeline for `./res/docx/<file_name>` (and which pictures are rendered).
+    Content hash is reused from `old_entry` when file size and mtime didn't change, so unchanged
+    files are not even read.
+
+    Returns:
+        dict: {"sha256", "size", "mtime_ns", "parser_version", "parse_rules", "render_settings", "outputs"},
+            where "outputs" is `{output name: {"week", "rendered"}}` built from these inputs.
+    """
+    path = './res/docx/'+file_name
+    stat = os.stat(path)
+    if old_entry and old_entry.get("size") == stat.st_size and old_entry.get("mtime_ns") == stat.st_mtime_ns:
+        sha256 = old_entry["sha256"]
+    else:
+        sha256 = file_hash(path)
+    return {
+        "sha256": sha256,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "parser_version": parser_version,
+        "parse_rules": get_parse_rules_hash(),
+        "render_settings": get_render_settings_hash(per_group, per_day, pic_preset),
+        "outputs": {},
+    }
+
+
+def is_same_input(entry, old_entry):
+    """
+    Checks whether outputs recorded in `old_entry` were built from the same inputs as described by `entry`.
+    """
+    if not old_entry or "outputs" not in old_entry:
+        return False
+    return all(old_entry.get(key) == entry[key] for key in ("sha256", "parser_version", "parse_rules", "render_settings"))
+
+
+def is_output_valid(output_name, week, output, pic_preset="quality"):
+    """
+    Checks whether output recorded in manifest (`{"week", "rendered"}`) is built for `week` and its files still exist.
+    """
+    if not output or output["week"] != week:
+        return False
+    if output["rendered"]:
+        return os.path.exists("./res/json/"+output_name+".json") and os.path.exists(get_pic_path(output_name, pic_preset))
+    return True
+
+
+def file_hash(path):
+    """
+    Returns sha256 hex digest of file content, read in chunks.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_parse_rules_hash():
+    """
+    Returns short hash of rules loaded by this process which affect produced JSON (`cleaning_rules_path`,
+    `abbreviations_path`, lesson classification tables `format_colors`, `type_rules`, `state_rules`),
+    so editing them rebuilds all files.
+    """
+    rules = cleaning_rules_hash+abbreviations_hash+repr(format_colors)+repr(type_rules)+repr(state_rules)
+    return hashlib.sha256(rules.encode()).hexdigest()[:16]
+
+
+def get_render_settings_hash(per_group=False, per_day=False, pic_preset="quality"):
+    """
+    Returns short hash of settings which affect rendered pictures (fonts, colors, sizes, format, which pictures are rendered).
+    """
+    settings = [
+        font_18.path, font_18.size, font_21.path, font_21.size, padding_px, row_height,
+        clr_dark_green, clr_light_green, clr_white, clr_black, clr_gray, clr_red, clr_dark_blue, state_styles,
+    ]
+    if per_group:
+        settings.append(["per_group", per_day])
+    if pic_preset != "quality":
+        settings.append(pic_presets[pic_preset])
+    return hashlib.sha256(json.dumps(settings).encode()).hexdigest()[:16]
+
+
+def _docx_handler_safe(args):
+    """
+    Runs `docx_handler` for one file, catching its errors, so one broken file doesn't stop others.
+    Collects `metrics` of file (plus cache hits / misses of this file) into result.
+    """
+    file_name, outputs, options = args
+    reset_metrics()
+    headers_report.clear()
+    caches_before = (shorten_text.cache_info(), text_bbox.cache_info())
+    start = perf_counter()
+    try:
+        result = {"rendered": docx_handler(file_name, outputs, **options), "error": None, "cached": False}
+    except Exception as e:
+        logger.exception('docx_handler failed for %s', file_name)
+        result = {"rendered": [], "error": repr(e), "cached": False}
+    file_metrics = reset_metrics()
+    file_metrics["seconds"] = perf_counter() - start
+    file_metrics["counters"].update(get_cache_counters(caches_before[0], shorten_text.cache_info(), "shorten_text"))
+    file_metrics["counters"].update(get_cache_counters(caches_before[1], text_bbox.cache_info(), "text_bbox"))
+    result["metrics"] = file_metrics
+    result["headers"] = dict(headers_report)
+    return file_name, result
+
+
+def load_group_registry():
+    """
+    Loads group registry `{docx_file_name: {column header: {"groups": [group ids], "problems": [[fragment, kind]]}}}`,
+    see `update_group_registry`.
+    """
+    try:
+        with open(group_registry_path, 'r', encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_group_registry(results, docx_files):
+    """
+    Updates group registry (`group_registry_path`) with column headers resolved in rebuilt files (see `resolve_column`),
+    keeping entries of other existing files, so registry always covers all files of `./res/docx`.
+    Logs unresolved / ambiguous headers of rebuilt files and groups found in several files.
+
+    Args:
+        results (dict): results of `docxs_handler`
+        docx_files (list): handled files
+
+    Returns:
+        dict: `{group id: [files having it]}`, see `get_group_index`.
+    """
+    old_registry = load_group_registry()
+    registry = {file_name: old_registry[file_name] for file_name in old_registry
+                if file_name in docx_files or os.path.exists('./res/docx/'+file_name)}
+    for file_name in results:
+        if results[file_name].get("headers"):
+            registry[file_name] = results[file_name]["headers"]
+            for column, resolved in results[file_name]["headers"].items():
+                for fragment, kind in resolved["problems"]:
+                    logger.warning('%s group "%s" in column "%s" of %s, resolved as %s', kind, fragment, column, file_name, resolved["groups"])
+    if registry != old_registry:
+        with atomic_open(group_registry_path, 'w', encoding="utf-8") as f:
+            json.dump(registry, f, indent=1, ensure_ascii=False)
+
+    group_index = get_group_index(registry)
+    for group, sources in group_index.items():
+        if len(sources) > 1 and any(source in results and results[source].get("headers") for source in sources):
+            logger.warning('group %s is in several files: %s', group, sources)
+    return group_index
+
+
+def get_group_index(registry=None):
+    """
+    Returns `{group id: [files having it]}` of group registry (loaded from `group_registry_path` by default).
+    """
+    registry = load_group_registry() if registry is None else registry
+    group_index = {}
+    for file_name in sorted(registry):
+        for resolved in registry[file_name].values():
+            for group in resolved["groups"]:
+                if file_name not in group_index.setdefault(group, []):
+                    group_index[group].append(file_name)
+    return group_index
+
+
+def docx_handler(file_name, outputs=None, per_group=False, per_day=False, force=False, pic_preset="quality", pages=False):
+    """
+    Pipeline for single file from `./res/docx`: parse XML -> `./res/json/*.json` -> `./res/pics/*.png`.
+    File is parsed once, keeping only tables of requested weeks (see `parse_weeks`), then every requested week is generated.
+    Outputs are written atomically, pictures whose data didn't change are not rendered again.
+
+    Args:
+        file_name (str): name of `.docx` file in `./res/docx`
+        outputs (dict): `{output name: week start "YYYY-MM-DD"}` to generate, see `get_outputs` (this week by default).
+        per_group (bool): also render picture for each group, see `render_groups`
+        per_day (bool): with `per_group`, also render picture for each day of each group
+        force (bool): render pictures even if their data didn't change
+        pic_preset (str): format / compression of pictures, one of `pic_presets`
+        pages (bool): with several weeks, also save all of them as one multi-page PDF `<file>_<first week>_<last week>.pdf`
+
+    Several weeks are rendered in batch by `render_weeks`, with the same layout for all weeks.
+
+    Returns:
+        list: names of outputs, for which file has table and json / png were written.
+    """
+    print("=> "+file_name) #keypoint debug
+    outputs = outputs or get_outputs(file_name)
+    with timed("unzip"):
+        zip = zipfile.ZipFile('./res/docx/'+file_name, 'r')
+    with zip:
+        count("bytes_read", os.path.getsize('./res/docx/'+file_name))
+        count("xml_bytes", zip.getinfo('word/document.xml').file_size)
+        weeks = {name: datetime.strptime(outputs[name], '%Y-%m-%d') for name in outputs}
+        with zip.open('word/document.xml', "r") as document, timed("parse"): # includes decompression and "table_lookup"
+            week_index = parse_weeks(document, weeks.values(), min(weeks.values()))
+    
+    file_name = file_name.split('.')[0]
+    rendered = []
+    batch = {} # weeks to render together
+    conn = open_store() # one connection for all writes of file
+    try:
+        for output_name, week_start in sorted(weeks.items(), key=lambda item: item[1]):
+            table_for_week = week_index.get(week_start, 0)
+            if(table_for_week == 0):
+                continue
+
+            path_to_json="./res/json/"+output_name+".json"
+            json_data = fetch_schedule_data(table_for_week, file_name)
+            with timed("json_write"), atomic_open(path_to_json, 'w', encoding="utf-8") as f:
+                json.dump(json_data, f, indent=1, ensure_ascii=False)
+            count("bytes_written", os.path.getsize(path_to_json))
+            with timed("store"):
+                store_schedule(json_data, file_name, outputs[output_name], conn=conn)
+            
+            #input("Press Enter to continue...") #dubug
+            if len(weeks) > 1:
+                batch[output_name] = (json_data, week_start)
+            else:
+                render_pics(json_data, [output_name], week_start, force, pic_preset, conn)
+            if per_group:
+                render_groups(json_data, output_name[len(file_name):], week_start, per_day, force, pic_preset, conn)
+            rendered.append(output_name)
+        if batch:
+            render_weeks(batch, force, pic_preset, get_pages_name(file_name, [outputs[name] for name in batch]) if pages else None, conn)
+    finally:
+        conn.close()
+    return rendered
+
+
+def open_store(path=None):
+    """
+    Opens (and creates if needed) timetable store - SQLite db with one row per lesson of each group,
+    see `store_schema`. Subjects and groups are interned into own tables.
+    """
+    conn = sqlite3.connect(path or store_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL') # parallel workers write, readers don't wait
+    conn.executescript(store_schema)
+    return conn
+
+
+def _intern(conn, table, names):
+    """
+    Returns `{name: id}` for `names` in `groups` / `subjects` table, adding missing ones.
+    """
+    conn.executemany('INSERT OR IGNORE INTO '+table+' (name) VALUES (?)', [(name,) for name in names])
+    ids = {}
+    for name in names:
+        ids[name] = conn.execute('SELECT id FROM '+table+' WHERE name = ?', (name,)).fetchone()[0]
+    return ids
+
+
+def store_schedule(json_data, source, week, path=None, conn=None):
+    """
+    Writes timetable (`json_data` from `fetch_schedule_data`) into timetable store in one transaction,
+    replacing lessons previously stored for the same `source` and `week`.
+    Differences from previously stored lessons (see `diff_lessons`) are appended to `changes` table,
+    first import of `source` / `week` is not a change.
+
+    Args:
+        json_data (dict): timetable of file
+        source (str): name of file timetable comes from
+        week (str): week start "YYYY-MM-DD"
+        path (str): store path, `store_path` by default
+        conn (sqlite3.Connection): already opened store (see `docx_handler`), it is left open
+
+    Returns:
+        list: detected changes, see `diff_lessons`.
+    """
+    rows = get_schedule_rows(json_data)
+    new_lessons = {(group, day, time, subject): (type, state) for group, day_id, day, time_id, time, subject, type, state in rows}
+
+    own_conn = conn is None
+    if own_conn:
+        conn = open_store(path)
+    try:
+        with conn:
+            old_lessons = {}
+            for group, day, time, subject, type, state in conn.execute('''SELECT g.name, l.day, l.time, s.name, l.type, l.state
+                    FROM lessons l JOIN groups g ON g.id = l.group_id JOIN subjects s ON s.id = l.subject_id
+                    WHERE l.source = ? AND l.week = ?''', (source, week)):
+                old_lessons[(group, day, time, subject)] = (type, state)
+            changes = diff_lessons(old_lessons, new_lessons) if old_lessons else []
+
+            group_ids = _intern(conn, 'groups', sorted({row[0] for row in rows}))
+            subject_ids = _intern(conn, 'subjects', sorted({row[5] for row in rows}))
+            conn.execute('DELETE FROM lessons WHERE source = ? AND week = ?', (source, week))
+            conn.executemany(
+                'INSERT INTO lessons (source, week, group_id, day_id, day, time_id, time, subject_id, type, state) VALUES (?,?,?,?,?,?,?,?,?,?)',
+                [(source, week, group_ids[group], day_id, day, time_id, time, subject_ids[subject], type, state)
+                 for group, day_id, day, time_id, time, subject, type, state in rows])
+            detected_at = datetime.now().isoformat(timespec='seconds')
+            conn.executemany(
+                'INSERT INTO changes (detected_at, source, week, group_name, day, time, subject, kind, old, new) VALUES (?,?,?,?,?,?,?,?,?,?)',
+                [(detected_at, source, week, *change) for change in changes])
+    finally:
+        if own_conn:
+            conn.close()
+    if changes:
+        logger.info('%s %s: %d changes', source, week, len(changes))
+    return changes
+
+
+def get_schedule_rows(json_data):
+    """
+    Flattens timetable into lessons: list of (group, day_id, day, time_id, time, subject, type, state).
+    """
+    rows = []
+    for column in json_data:
+        groups = json_data[column]["groups"] or [column]
+        for day_id, day in enumerate(list(json_data[column])[1:]):
+            for time_id, time in enumerate(json_data[column][day]):
+                for subject in json_data[column][day][time]:
+                    lesson = json_data[column][day][time][subject]
+                    for group in groups:
+                        rows.append((group, day_id, day.strip(), time_id, time, subject, lesson["type"], lesson["state"]))
+    return rows
+
+
+def diff_schedules(old_json_data, new_json_data):
+    """
+    Structural diff of two timetables (`json_data` from `fetch_schedule_data`), see `diff_lessons`.
+    """
+    old_lessons = {(row[0], row[2], row[4], row[5]): (row[6], row[7]) for row in get_schedule_rows(old_json_data)}
+    new_lessons = {(row[0], row[2], row[4], row[5]): (row[6], row[7]) for row in get_schedule_rows(new_json_data)}
+    return diff_lessons(old_lessons, new_lessons)
+
+
+def diff_lessons(old_lessons, new_lessons):
+    """
+    Compares lessons `{(group, day, time, subject): (type, state)}`.
+
+    Returns:
+        list: list of changes (group, day, time, subject, kind, old, new), where kind is
+            "added" / "removed" (old / new - state of lesson), "type" or "state" (old / new - changed value).
+    """
+    changes = []
+    for key in new_lessons:
+        if key not in old_lessons:
+            changes.append((*key, "added", None, new_lessons[key][1]))
+            continue
+        if old_lessons[key][0] != new_lessons[key][0]:
+            changes.append((*key, "type", old_lessons[key][0], new_lessons[key][0]))
+        if old_lessons[key][1] != new_lessons[key][1]:
+            changes.append((*key, "state", old_lessons[key][1], new_lessons[key][1]))
+    for key in old_lessons:
+        if key not in new_lessons:
+            changes.append((*key, "removed", old_lessons[key][1], None))
+    return changes
+
+
+def get_changes(since_id=0, group=None, week=None, path=None):
+    """
+    Query API of change log: changes detected by `store_schedule` with id > `since_id`,
+    optionally only of `group` / `week`, in order of detection.
+    Notifiers keep id of last seen change and pass it as `since_id`.
+
+    Returns:
+        list: list of dicts {"id", "detected_at", "source", "week", "group", "day", "time", "subject", "kind", "old", "new"}
+    """
+    query = 'SELECT id, detected_at, source, week, group_name, day, time, subject, kind, old, new FROM changes WHERE id > ?'
+    params = [since_id]
+    if group:
+        query = query + ' AND group_name = ?'
+        params.append(group)
+    if week:
+        query = query + ' AND week = ?'
+        params.append(week)
+    conn = open_store(path)
+    try:
+        rows = conn.execute(query + ' ORDER BY id', params).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(("id", "detected_at", "source", "week", "group", "day", "time", "subject", "kind", "old", "new"), row)) for row in rows]
+
+
+def get_group_lessons(group, week=None, day=None, path=None):
+    """
+    Query API of timetable store: lessons of `group` in `week` (week from `get_dates` by default),
+    optionally only on `day`, ordered by day and time.
+
+    Returns:
+        list: list of dicts {"week", "day", "time", "subject", "type", "state", "source"}
+    """
+    week = week or get_dates()[1].strftime('%Y-%m-%d')
+    query = '''SELECT l.week, l.day, l.time, s.name, l.type, l.state, l.source
+        FROM lessons l JOIN groups g ON g.id = l.group_id JOIN subjects s ON s.id = l.subject_id
+        WHERE g.name = ? AND l.week = ?'''
+    params = [group, week]
+    if day:
+        query = query + ' AND l.day = ?'
+        params.append(day.strip())
+    conn = open_store(path)
+    try:
+        rows = conn.execute(query + ' ORDER BY l.day_id, l.time_id', params).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(("week", "day", "time", "subject", "type", "state", "source"), row)) for row in rows]
+
+
+def get_groups(week=None, path=None):
+    """
+    Query API of timetable store: names of groups having lessons in `week` (all weeks by default).
+    """
+    conn = open_store(path)
+    try:
+        if week:
+            rows = conn.execute('SELECT DISTINCT g.name FROM lessons l JOIN groups g ON g.id = l.group_id WHERE l.week = ? ORDER BY g.name', (week,)).fetchall()
+        else:
+            rows = conn.execute('SELECT name FROM groups ORDER BY name').fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+
+def load_api_index():
+    """
+    Loads timetables of all outputs recorded in manifest (`res/json/<output>.json`) into `api_index` of HTTP API,
+    split by group like `render_groups`, and clears `api_cache`. New index replaces old one at once, so requests
+    being served meanwhile see either old or new data.
+
+    Returns:
+        dict: `api_index`
+    """
+    global api_index, api_index_mtime
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        mtime = 0
+    index = {}
+    for entry in load_manifest().values():
+        for output_name, output in entry.get("outputs", {}).items():
+            if not output["rendered"]:
+                continue
+            try:
+                with open("./res/json/"+output_name+".json", 'r', encoding="utf-8") as f:
+                    json_data = json.load(f)
+            except (OSError, ValueError):
+                logger.warning('api: skipped missing / broken output %s', output_name)
+                continue
+            for column in json_data:
+                for group in json_data[column]["groups"] or [column]:
+                    group_data = index.setdefault(group, {}).setdefault(output["week"], ({}, None))[0]
+                    group_data[column] = json_data[column]
+    week_starts = {week: datetime.strptime(week, '%Y-%m-%d') for weeks in index.values() for week in weeks}
+    for group, weeks in index.items():
+        for week, (group_data, fingerprint) in weeks.items():
+            weeks[week] = (group_data, get_pic_fingerprint(group_data, week_starts[week], api_pic_preset))
+    with api_lock:
+        api_index, api_index_mtime = index, mtime
+        api_cache.clear()
+    count_api("reloads")
+    logger.info('api: loaded %d groups', len(index))
+    return index
+
+
+def count_api(counter, n=1):
+    """
+    Adds `n` to `counter` of HTTP API `api_metrics`. They are kept apart from per-file `metrics` (see `count`),
+    since requests are served by other threads meanwhile files are handled.
+    """
+    with api_lock:
+        api_metrics[counter] = api_metrics[counter] + n
+
+
+def get_api_index():
+    """
+    Returns `api_index`, (re)loading it if manifest was changed since, e.g. by `docxs_handler` of another process.
+    """
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        mtime = 0
+    if mtime != api_index_mtime:
+        load_api_index()
+    return api_index
+
+
+def get_api_payload(group, week=None, day=None, format="json"):
+    """
+    Returns encoded timetable of `group` for HTTP API, cached in `api_cache` (LRU of `api_cache_size` responses).
+
+    Args:
+        group (str): group name, as in `get_groups` or any spelling accepted by `canonical_group`
+        week (str): any date "YYYY-MM-DD" of week, week from `get_dates` by default
+        day (str): only this day of week (case-insensitive), None - whole week
+        format (str): "json" (`{column: json_data[column]}` of `fetch_schedule_data`) or "pic" (picture of `api_pic_preset`)
+
+    Returns:
+        tuple: (etag, body bytes), or None if there is no such group / week / day.
+        Etag is derived from schedule fingerprint (`get_pic_fingerprint`), so it changes only when data or render settings change.
+    """
+    index = get_api_index()
+    group = group if group in index else canonical_group(group)
+    week = (datetime.strptime(week, '%Y-%m-%d') if week else get_dates()[1])
+    week = (week - timedelta(days=week.weekday())).strftime('%Y-%m-%d')
+    if group not in index or week not in index[group]:
+        return None
+    group_data, fingerprint = index[group][week]
+    if day:
+        day_data = {}
+        for column in group_data:
+            days = [name for name in list(group_data[column])[1:] if name.strip().upper() == day.strip().upper()]
+            if days:
+                day_data[column] = {"groups": group_data[column]["groups"], days[0]: group_data[column][days[0]]}
+        if not day_data:
+            return None
+        group_data = day_data
+
+    key = (group, week, day and day.strip().upper(), format)
+    with api_lock:
+        cached = api_cache.get(key)
+        if cached and cached[0].startswith('"'+fingerprint[:16]): # not put by request which raced with reload
+            api_cache.move_to_end(key)
+            count_api("cache_hits")
+            return cached
+    count_api("cache_misses")
+    etag = '"'+fingerprint[:16]+hashlib.sha256(json.dumps(key[2:], ensure_ascii=False).encode()).hexdigest()[:8]+'"'
+    if format == "pic":
+        start = perf_counter()
+        layout = build_layout(group_data) # not `draw_timetable`, its `timed` stages belong to file being handled
+        img = _draw_timetable(resolve_slots(group_data, layout), layout, datetime.strptime(week, '%Y-%m-%d'), pic_presets[api_pic_preset]["mode"])
+        buffer = io.BytesIO()
+        img.save(buffer, format=pic_presets[api_pic_preset]["format"], **pic_presets[api_pic_preset]["params"])
+        body = buffer.getvalue()
+        count_api("render_seconds", perf_counter() - start)
+    else:
+        body = json.dumps(group_data, ensure_ascii=False).encode()
+    with api_lock:
+        api_cache[key] = (etag, body)
+        api_cache.move_to_end(key)
+        while len(api_cache) > api_cache_size:
+            api_cache.popitem(last=False)
+    return etag, body
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of HTTP API, see `start_api`.
+    """
+    def do_GET(self):
+        count_api("requests")
+        parts = [unquote(part) for part in urlsplit(self.path).path.split('/') if part]
+        format = "json"
+        if parts and '.' in parts[-1]:
+            parts[-1], extension = parts[-1].rsplit('.', 1)
+            format = "pic" if extension == pic_presets[api_pic_preset]["format"].lower() else extension # .png / .webp, by preset
+        try:
+            if parts == ["groups"] and format == "json":
+                index = get_api_index()
+                self._send(200, json.dumps({group: sorted(index[group]) for group in sorted(index)}, ensure_ascii=False).encode(), "json")
+                return
+            if parts == ["metrics"] and format == "json":
+                with api_lock:
+                    body = json.dumps(api_metrics).encode()
+                self._send(200, body, "json")
+                return
+            if len(parts) < 2 or len(parts) > 4 or parts[0] != "groups" or format not in ("json", "pic"):
+                self._send(404, b'{"error": "not found"}', "json")
+                return
+            payload = get_api_payload(parts[1], parts[2] if len(parts) > 2 else None, parts[3] if len(parts) > 3 else None, format)
+        except ValueError:
+            self._send(400, b'{"error": "bad date, expected YYYY-MM-DD"}', "json")
+            return
+        if payload is None:
+            self._send(404, b'{"error": "no timetable"}', "json")
+        elif payload[0] in [etag.strip() for etag in self.headers.get("If-None-Match", "").split(',')]:
+            count_api("not_modified")
+            self._send(304, b'', format, payload[0])
+        else:
+            self._send(200, payload[1], format, payload[0])
+
+    def _send(self, status, body, format, etag=None):
+        self.send_response(status)
+        content_type = "image/"+pic_presets[api_pic_preset]["format"].lower() if format == "pic" else "application/json; charset=utf-8"
+        self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache") # clients revalidate via If-None-Match
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('api: '+format, *args)
+
+
+def start_api(port=8080, host="127.0.0.1", pic_preset="quality", background=True):
+    """
+    Starts local HTTP API over parsed timetables in background thread (or serves in this thread if not `background`):
+
+        GET /groups                                 - {group: [weeks]}
+        GET /groups/<group>[/<date>[/<day>]]        - JSON of group for week containing date (current week by default) / day
+        GET /groups/<group>[/<date>[/<day>]].png    - picture of the same (.webp with "webp" `pic_preset`)
+        GET /metrics                                - `api_metrics` (requests, 304s, cache hits / misses, render time, reloads)
+
+    Responses have ETag, `If-None-Match` gets 304 while schedule of group is the same.
+    Data is reloaded when `docxs_handler` of this process finishes or manifest is changed by other process.
+
+    Returns:
+        ThreadingHTTPServer: running server, `shutdown()` stops it.
+    """
+    global api_pic_preset
+    api_pic_preset = pic_preset
+    load_api_index()
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    logger.info('api: serving on http://%s:%s', host, port)
+    if not background:
+        server.serve_forever()
+    else:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_users():
+    """
+    Loads users db (`users_db_path` snapshot + batches from `users_journal_path`) into `users`
+    and builds `group_subscribers` index. Incomplete last batch of journal (e.g. after crash) is ignored.
+    Called on first use of `update_subscriptions` / `get_subscribers`, call it again to reload changes of other processes.
+
+    Returns:
+        dict: `users`
+    """
+    global users_journal_size
+    with users_lock:
+        try:
+            with open(users_db_path, 'r', encoding="utf-8") as f:
+                loaded = json.load(f)
+        except (OSError, ValueError):
+            loaded = {}
+        users.clear()
+        users.update(loaded)
+        users_journal_size = 0
+        try:
+            with open(users_journal_path, 'r', encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        batch = json.loads(line)
+                    except ValueError:
+                        logger.warning('ignored broken batch of %s', users_journal_path)
+                        users_journal_size = users_journal_limit + 1 # compact below, so next batches are not appended to broken line
+                        break
+                    _apply_user_changes(batch)
+                    users_journal_size = users_journal_size + len(batch)
+        except OSError:
+            pass
+        group_subscribers.clear()
+        for user_id in users:
+            for group in users[user_id].get("groups", []):
+                group_subscribers.setdefault(group, set()).add(user_id)
+        if users_journal_size > users_journal_limit:
+            _compact_users()
+    return users
+
+
+def _apply_user_changes(changes):
+    """
+    Applies changes `[[user id, group, subscribe (bool)], ...]` to `users` and `group_subscribers`.
+    """
+    for user_id, group, subscribe in changes:
+        groups = users.setdefault(user_id, {}).setdefault("groups", [])
+        if subscribe and group not in groups:
+            groups.append(group)
+            group_subscribers.setdefault(group, set()).add(user_id)
+        elif not subscribe and group in groups:
+            groups.remove(group)
+            group_subscribers.get(group, set()).discard(user_id)
+
+
+def update_subscriptions(changes):
+    """
+    Subscribes / unsubscribes users to groups in one batch: applies `changes` in memory and appends them
+    to `users_journal_path` as single line (written at once and fsync-ed), instead of rewriting whole users db.
+    Journal is compacted into `users_db_path` when it grows over `users_journal_limit` changes.
+
+    Args:
+        changes (list): list of `(user id, group name, subscribe)`, where `subscribe` is True to subscribe, False to unsubscribe.
+    """
+    global users_journal_size
+    changes = [[str(user_id), group, bool(subscribe)] for user_id, group, subscribe in changes]
+    if not changes:
+        return
+    with users_lock:
+        if users_journal_size is None:
+            load_users()
+        with open(users_journal_path, 'a', encoding="utf-8") as f:
+            f.write(json.dumps(changes, ensure_ascii=False)+"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _apply_user_changes(changes)
+        users_journal_size = users_journal_size + len(changes)
+        if users_journal_size > users_journal_limit:
+            _compact_users()
+
+
+def compact_users():
+    """
+    Writes `users` into `users_db_path` atomically and empties journal.
+    """
+    with users_lock:
+        if users_journal_size is None:
+            load_users()
+        _compact_users()
+
+
+def _compact_users():
+    global users_journal_size
+    with atomic_open(users_db_path, 'w', encoding="utf-8") as f:
+        json.dump(users, f, indent=1, ensure_ascii=False)
+    with atomic_open(users_journal_path, 'w', encoding="utf-8"):
+        pass
+    users_journal_size = 0
+
+
+def get_subscribers(groups):
+    """
+    Bulk lookup of users who need new picture when `groups` changed, via `group_subscribers` index.
+
+    Args:
+        groups (iterable): changed group names, e.g. `{change["group"] for change in get_changes(since_id)}`
+
+    Returns:
+        dict: `{user id: [changed groups user is subscribed to]}`
     """
-    if not os.path.exists("./logs"):        os.makedirs("./logs")
-    if not os.path.exists("./res"):         os.makedirs("./res")
-    if not os.path.exists("./res/docx"):    os.makedirs("./res/docx")
-    if not os.path.exists("./res/pics"):    os.makedirs("./res/pics")
-    if not os.path.exists('./res/json'):    os.makedirs("./res/json")
-    if not os.path.exists("./res/users_db"):   
-        with open('./res/users_db', 'w', encoding="utf-8") as f: 
-            json.dump({}, f, indent=1, ensure_ascii=False)
-        f.close()
+    subscribers = {}
+    with users_lock:
+        if users_journal_size is None:
+            load_users()
+        for group in sorted(set(groups)):
+            for user_id in group_subscribers.get(group, ()):
+                subscribers.setdefault(user_id, []).append(group)
+    return subscribers
 
 
-def log_options_init():    
+@contextmanager
+def atomic_open(path, mode='w', **kwargs):
     """
-    Initializes the logging options
+    Opens temp file next to `path` for writing and moves it to `path` only when writing succeeded,
+    so readers never see partially written file.
     """
-    logger.setLevel(logging.DEBUG)
-    formatter = logging.Formatter(fmt='%(asctime)s %(levelname)s %(message)s',datefmt='%m-%d-%y %H:%M:%S')
-    fh = TimedRotatingFileHandler('./logs/log', when='midnight')
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
-    logger.info('> log options initialized')
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.'+os.path.basename(path)+'.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
 
-def grab_docx_files():
+@lru_cache(maxsize=16384)
+def text_bbox(text, font):
     """
-    Downloads docx files going through site via DFS and store files to `./res/docx` 
-    Returns:
-        dict: dictionary containing the paths of `.docx` files found on the website.
+    Returns size box (x1,y1,x2,y2) of `text` drawn at (0,0) with `font`.
+    Cached per (text, font) for whole run, since same times / subjects repeat across columns and files.
     """
-    json_data={}
-    logger.info('call grab_docx_files()')
-    mntu_start_url = mntu_base_url+'index.php?p=30&id_f=114'
-    s = requests.Session() 
-    s.get(mntu_start_url) # GET request to site
-    s.post(mntu_start_url, data={'password_lib': mntu_password}) # login to site.
-
-    def dfs(node, path_on_site="", path_in_file=""):    #favtutor.com/blogs/depth-first-search-python
-            #print('DFS: '+path_on_site+'\n'+path_in_file) #debug
-            trs = BeautifulSoup(s.get(node).content , "html.parser").find('table', {"class": "forumline"}).find_all('tr')[2:]
-            
-            for tr in trs:
-                file_name = tr.select_one('a').contents[0]
-                file_href = tr.select_one('a')['href']
-                temp_path_in_file=path_in_file+'/'+file_name  # header dir name
-                
-                print('['+file_name+']')
-                if ".docx" in file_name:
-                    dpath.util.new(json_data, temp_path_in_file, 'null' ) 
-                    '''
-                    temp = s.get(app.mntu_base_url + file_href)
-                    with open('./res/docx/'+file_name+'.docx', 'wb') as output:
-                        output.write(temp.content)
-                    output.close()
-                    '''
-                elif ".doc" in file_name:
-                    pass
-                else:
-                    if "викладачі" not in file_name.lower():
-                        temp_path_on_site=path_on_site+'/'+file_name
-                        dpath.util.new(json_data, temp_path_in_file, {})
-                        dfs( mntu_base_url+file_href, temp_path_on_site, temp_path_in_file )        
-    dfs(mntu_start_url)
-    return json_data
+    return measure_draw.textbbox((0, 0), text, font=font)
 
 
-def docxs_handler():
+class Layout(NamedTuple):
     """
-    Docx driver handler, which extracts data / parse it on XML level and stack in json.
+    Geometry of timetable picture (in final orientation), computed by `build_layout`.
     """
-    logger.info('call docxs_handler')
-    dir_content = os.listdir('./res/docx')
-    docx_files = [x for x in dir_content if not x.startswith('~')] #exclude temp / open files
-    for file_name in docx_files:
-        json_data={}
-        print("=> "+file_name) #keypoint debug
-        zip = zipfile.ZipFile('./res/docx/'+file_name, 'r')
-        file = zip.open('word/document.xml', "r").read() #bytes like obj (without utf)
-        
-        file_name = file_name.split('.')[0]
-        path_to_json="./res/json/"+file_name+".json"
-        
-        table_for_this_week = get_tabel(file)
-        if(table_for_this_week != 0):
-            if not os.path.exists(path_to_json):       
-                open(path_to_json, 'w').close()
-
-            json_data = fetch_schedule_data(table_for_this_week, file_name)
-        
-            with open(path_to_json, 'w', encoding="utf-8") as f:
-                json.dump(json_data, f, indent=1, ensure_ascii=False)
-            f.close()    
-            
-            #input("Press Enter to continue...") #dubug
-            json_to_pic(json_data, file_name)
+    width: int
+    height: int
+    time_width: int                         # width of 1st column with time
+    columns: Tuple[Tuple[str, int, int], ...]       # (column name, x, width)
+    rows: Tuple[Tuple[str, str, int, bool], ...]    # (day, time, y, is first row of day)
+    days: Tuple[Tuple[str, int, int], ...]          # (day, y, height)
 
 
-def build_canvas(json_data):
+def build_layout(json_data, widths=None):
     """
-    Creates blank canvas with dimensions calculated based `json_data` structure.
+    Computes layout of timetable picture based `json_data` structure in one pass.
     
     It computes:
-        - number of rows (total_time_rows)
-        - maximum 1st column width (max_time_width),
-        - maximum width for other groups/columns (max_column_width)
+        - rows of (day, time) and their positions
+        - maximum 1st column width (time_width),
+        - width and position for other groups/columns (subject widths measured via `text_bbox`)
     Args:
         json_data (dict): data representing timetable to visualize
+        widths (dict): widths measured once for several weeks (see `get_shared_widths`), used instead of measuring
     
     Returns:
-        list: list canvas obj and dimensions [img, total_time_rows, max_time_width, *max_column_width].
+        Layout: picture size and positions of rows / columns.
     """
-    img = Image.new("RGB", (0,0), clr_dark_green)
-    draw = ImageDraw.Draw(img)
+    columns = list(json_data)
+    days = list(json_data[columns[0]])[1:] if columns else [] # all columns have same days & times
 
-    total_time_rows = 0     #rows num
-    max_time_width = 0      #max width column with time (1st column)
-    max_column_width = []   #max width of other columns
-    for column in json_data:
-        total_time_rows = 0 
-        max_subject_width = 0  #max len
-        for day in list(json_data[column])[1:]:
-            total_time_rows = total_time_rows + len(json_data[column][day])
-            for time in json_data[column][day]:
-                text_box = draw.textbbox((0, 0), time, font=font_18) # calc time size (x1,y1,x2,y2)
-                if(text_box[2]>max_time_width):
-                    max_time_width = text_box[2]
-                for subject in json_data[column][day][time]:
-                    text_box = draw.textbbox((0, 0), subject, font=font_18) # calc subject size (x1,y1,x2,y2)
-                    if(text_box[2]>max_subject_width):
-                        max_subject_width = text_box[2]
-        max_column_width.append(max_subject_width+padding_px)
-    max_time_width = max_time_width + padding_px
+    time_width = 0
+    rows = []
+    day_spans = []
+    axis_y_pos = row_height*2
+    for day in days:
+        day_spans.append((day, axis_y_pos, len(json_data[columns[0]][day])*row_height))
+        for time_id, time in enumerate(json_data[columns[0]][day]):
+            time_width = max(time_width, text_bbox(time, font_18)[2])
+            rows.append((day, time, axis_y_pos, time_id == 0))
+            axis_y_pos = axis_y_pos + row_height
+    time_width = time_width + padding_px
+    if widths:
+        time_width = widths["time"]
+
+    layout_columns = []
+    axis_x_pos = row_height + time_width
+    for column in columns:
+        if widths:
+            column_width_px = widths["columns"][column]
+        else:
+            max_subject_width = 0
+            for day in days:
+                for time in json_data[column][day]:
+                    for subject in json_data[column][day][time]:
+                        max_subject_width = max(max_subject_width, text_bbox(subject, font_18)[2])
+            column_width_px = max_subject_width+padding_px
+        layout_columns.append((column, axis_x_pos, column_width_px))
+        axis_x_pos = axis_x_pos + column_width_px
+    return Layout(axis_x_pos, axis_y_pos, time_width, tuple(layout_columns), tuple(rows), tuple(day_spans))
+
+
+def get_shared_widths(json_datas):
+    """
+    Measures widths of time column and of every column once for several weeks of timetable (max over weeks),
+    so all weeks are drawn with the same columns, see `build_layout`.
+
+    Returns:
+        dict: {"time": px, "columns": {column: px}}
+    """
+    widths = {"time": 0, "columns": {}}
+    for json_data in json_datas:
+        layout = build_layout(json_data)
+        widths["time"] = max(widths["time"], layout.time_width)
+        for column, axis_x_pos, column_width_px in layout.columns:
+            widths["columns"][column] = max(widths["columns"].get(column, 0), column_width_px)
+    return widths
+
+
+def draw_timetables(weeks_data, mode="RGB", widths=None):
+    """
+    Batch version of `draw_timetable` for several weeks of one file. Layout widths are measured once for all weeks
+    (`get_shared_widths`) and frame (see `_draw_frame`) is drawn once for each distinct layout (weeks usually
+    have the same days & times), then copied for every week, which gets only its header and subjects drawn.
 
-    img = Image.new(img.mode, (img.size[0]+ row_height*(total_time_rows+2), img.size[1]), clr_dark_green)
-    img = Image.new(img.mode, (img.size[0], img.size[1]+row_height+max_time_width+sum(max_column_width)), clr_dark_green) # Day_name_labels + time_w + columns
-    return [img, total_time_rows, max_time_width, *max_column_width]
+    Args:
+        weeks_data (dict): `{name: (json_data, week_start)}`
+        mode (str): "RGB" or "P", see `pic_presets`
+        widths (dict): already measured `get_shared_widths` of weeks
+
+    Returns:
+        dict: `{name: Image}`
+    """
+    frames = {}
+    images = {}
+    with timed("layout"):
+        widths = widths or get_shared_widths([json_data for json_data, week_start in weeks_data.values()])
+        layouts = {name: build_layout(json_data, widths) for name, (json_data, week_start) in weeks_data.items()}
+        slots = {name: resolve_slots(json_data, layouts[name]) for name, (json_data, week_start) in weeks_data.items()}
+    with timed("draw"):
+        for name, (json_data, week_start) in weeks_data.items():
+            layout = layouts[name]
+            if layout not in frames:
+                frames[layout] = _draw_frame(layout, mode, with_header=False)
+            img = frames[layout].copy()
+            draw = ImageDraw.Draw(img)
+            _draw_header(draw, layout.width, week_start)
+            _draw_subjects(draw, slots[name], layout)
+            images[name] = img
+    return images
 
 
-def json_to_pic(json_data, file_name):
+def json_to_pic(json_data, file_name, week_start=None, pic_preset="quality"):
     """
-    Converts timetable data (in `json_data`) into image (PNG format).
+    Converts timetable data (in `json_data`) into image (PNG format, or WebP - see `pic_presets`).
 
     Args:
         json_data (dict): Data structure containing the timetable to be rendered.
         file_name (str): Name of the output image file.
+        week_start (datetime): start of week shown in header (week from `get_dates` by default).
+        pic_preset (str): format / compression of image, one of `pic_presets`.
     
     Returns:
         None
     """
-    cancas_and_dimensions = build_canvas(json_data)
-    img = cancas_and_dimensions[0]
-    max_time_width = cancas_and_dimensions[2]
-    column_width_px =  cancas_and_dimensions[len(cancas_and_dimensions)-len(json_data):]
-    #print(column_width_px) #keypoint debug
-    
-    #in block below draw the days of the week, rotate image.
-    draw = ImageDraw.Draw(img)
-    for column in json_data:
-        axis_x_pos=0
-        for day in reversed(list(json_data[column])[1:]):
-            total_rows_size_in_day = len(json_data[column][day])*row_height
-            text_box = draw.textbbox((0, 0), day, font=font_18) # get size (x1,y1,x2,y2)
-            draw.text(( axis_x_pos + (total_rows_size_in_day-text_box[2])/2, (row_height-text_box[3])/2), day, font=font_18,  fill=clr_white) # print days of week
+    save_pic(draw_timetable(json_data, week_start, pic_presets[pic_preset]["mode"]), file_name, pic_preset)
 
-            axis_x_pos=axis_x_pos+total_rows_size_in_day
-            #draw.line((axis_x_pos, 0, axis_x_pos, img.size[1]), fill=clr_red) #keypoint debug. Line between day labels
-        break
-    img = img.rotate(90, Image.NEAREST, expand = 1) #rotate img
 
-    dates = get_dates()
-    start_week = dates[1]
-    end_week = dates[2]
-    header_rozklad_date_range_text="Розклад ("+str(start_week).split(' ')[0].replace('-','.')+" - "+ str(end_week).split(' ')[0].replace('-','.')+")"   #text like - "Розклад (2022.04.11 - 2022.04.17)"
-    #print(header_rozklad_date_range_text) #keypoint debug
-    text_box = draw.textbbox((0, 0), header_rozklad_date_range_text, font=font_21) 
+def save_pic(img, file_name, pic_preset="quality"):
+    """
+    Atomically saves image as `./res/pics/<file_name>.png` (`.webp`), in format of `pic_preset`.
+    """
+    preset = pic_presets[pic_preset]
+    with timed("pic_save"), atomic_open(get_pic_path(file_name, pic_preset), 'wb') as f:
+        img.save(f, format=preset["format"], **preset["params"])
+        count("bytes_written", f.tell())
+
+
+def get_pic_path(file_name, pic_preset="quality"):
+    """
+    Returns path of picture `file_name` saved with `pic_preset`.
+    """
+    return "./res/pics/"+file_name+"."+pic_presets[pic_preset]["format"].lower()
+
+
+def get_pages_name(file_name, weeks):
+    """
+    Returns name of multi-page PDF with `weeks` ("YYYY-MM-DD") of `file_name`: `<file>_<first week>_<last week>`.
+    """
+    return file_name.split('.')[0]+"_"+min(weeks)+"_"+max(weeks)
+
+
+def save_pages(images, file_name):
+    """
+    Atomically saves `images` as pages of one PDF `./res/pics/<file_name>.pdf`.
+    """
+    with timed("pic_save"), atomic_open("./res/pics/"+file_name+".pdf", 'wb') as f:
+        images[0].save(f, format="PDF", save_all=True, append_images=images[1:])
+        count("bytes_written", f.tell())
+
+
+def draw_timetable(json_data, week_start=None, mode="RGB"):
+    """
+    Draws timetable data (in `json_data`) on new image, see `json_to_pic`.
+
+    Returns:
+        Image: drawn timetable, "RGB" or palette ("P") image according to `mode`.
+    """
+    with timed("layout"):
+        layout = build_layout(json_data)
+        slots = resolve_slots(json_data, layout)
+    with timed("draw"):
+        return _draw_timetable(slots, layout, week_start, mode)
+
+
+def _draw_timetable(slots, layout, week_start=None, mode="RGB"):
+    """
+    Draws timetable (subjects of `resolve_slots`) on new image according to `layout`, see `draw_timetable`.
+    Image is drawn in final orientation, in "RGB" or palette ("P", `pic_palette`, text without antialiasing) `mode`.
+    """
+    img = _draw_frame(layout, mode, week_start)
+    _draw_subjects(ImageDraw.Draw(img), slots, layout)
+    return img
+
+
+def _draw_frame(layout, mode="RGB", week_start=None, with_header=True):
+    """
+    Draws everything of timetable except subjects: days, header with dates of week (if `with_header`), times, lines, column names.
+    Frame depends only on `layout` (and week in header), so it can be drawn once for many weeks, see `draw_timetables`.
+    """
+    img = Image.new(mode, (layout.width, layout.height), clr_dark_green)
+    if mode == "P":
+        img.putpalette(pic_palette)
     draw = ImageDraw.Draw(img)
-    draw.text(((img.size[0]-text_box[2])/2, (row_height-text_box[3])/2), header_rozklad_date_range_text, font=font_21,  fill=clr_white) 
+
+    #in block below draw the days of the week on narrow strip (mask), rotate it and paste as 1st column.
+    days_strip = Image.new("1" if mode == "P" else "L", (layout.height, row_height)) # days go along x before rotation
+    strip_draw = ImageDraw.Draw(days_strip)
+    for day, axis_y_pos, total_rows_size_in_day in layout.days:
+        axis_x_pos = layout.height - axis_y_pos - total_rows_size_in_day # position of day after rotation
+        text_box = text_bbox(day, font_18)
+        strip_draw.text(( axis_x_pos + (total_rows_size_in_day-text_box[2])/2, (row_height-text_box[3])/2), day, font=font_18,  fill=255) # print days of week
+    draw.bitmap((0, 0), days_strip.transpose(Image.Transpose.ROTATE_90), fill=clr_white)
+
+    if with_header:
+        _draw_header(draw, img.size[0], week_start)
     draw.line((row_height, row_height, img.size[0], row_height), fill=clr_black) 
     draw.line((row_height, 0, row_height, img.size[1]), fill=clr_black) #vertical line before time
 
-    text_box = draw.textbbox((0, 0), "ЧАС", font=font_21) 
-    draw.text((row_height+(max_time_width-text_box[2])/2, row_height-2+(row_height-text_box[3])/2), "ЧАС", font=font_21,  fill=clr_white)
+    text_box = text_bbox("ЧАС", font_21)
+    draw.text((row_height+(layout.time_width-text_box[2])/2, row_height-2+(row_height-text_box[3])/2), "ЧАС", font=font_21,  fill=clr_white)
 
     #block which prints time & horizontal lines
-    for column in json_data:
-        draw.rectangle(((row_height+1, row_height*2), (row_height+ max_time_width, img.size[1])), fill=clr_light_green) #time column background
-        draw.rectangle(((row_height+max_time_width+1, row_height*2+1), (img.size[0], img.size[1])), fill=clr_white) # main area white background
-        axis_y_pos=row_height*2
-        for day in list(json_data[column])[1:]:
-            for time_id, time in enumerate(json_data[column][day]):
-                text_box = draw.textbbox((0, 0), time, font=font_18)  
-                draw.text((row_height + (max_time_width-text_box[2])/2, axis_y_pos-1 + (row_height-text_box[3])/2 ), time, font=font_18,  fill=clr_black) 
-                
-                if(time_id==0):
-                    draw.line((0, axis_y_pos, img.size[0], axis_y_pos), fill=clr_black) # black line dividing the days of the week
-                else:
-                    draw.line((row_height+1, axis_y_pos, img.size[0], axis_y_pos), fill=clr_gray) # silver lines between each line.
-                axis_y_pos = axis_y_pos + row_height
-        break
+    if layout.columns:
+        draw.rectangle(((row_height+1, row_height*2), (row_height+ layout.time_width, img.size[1])), fill=clr_light_green) #time column background
+        draw.rectangle(((row_height+layout.time_width+1, row_height*2+1), (img.size[0], img.size[1])), fill=clr_white) # main area white background
+        for day, time, axis_y_pos, is_first_in_day in layout.rows:
+            text_box = text_bbox(time, font_18)
+            draw.text((row_height + (layout.time_width-text_box[2])/2, axis_y_pos-1 + (row_height-text_box[3])/2 ), time, font=font_18,  fill=clr_black) 
+            
+            if(is_first_in_day):
+                draw.line((0, axis_y_pos, img.size[0], axis_y_pos), fill=clr_black) # black line dividing the days of the week
+            else:
+                draw.line((row_height+1, axis_y_pos, img.size[0], axis_y_pos), fill=clr_gray) # silver lines between each line.
 
-    axis_x_pos=row_height+max_time_width
-    draw.rectangle(((axis_x_pos, row_height+1), (img.size[0], row_height*2-1)), fill=clr_light_green)
-    for column_id, column in enumerate(json_data):
-        axis_y_pos = row_height*2
-        text_box = draw.textbbox((0, 0), column, font=font_18)  
+    draw.rectangle(((row_height+layout.time_width, row_height+1), (img.size[0], row_height*2-1)), fill=clr_light_green)
+    for column, axis_x_pos, column_width_px in layout.columns:
+        text_box = text_bbox(column, font_18)
 
-        draw.text((axis_x_pos + (column_width_px[column_id]-text_box[2])/2, row_height+(row_height-text_box[3])/2), column, font=font_18,  fill=clr_black) 
+        draw.text((axis_x_pos + (column_width_px-text_box[2])/2, row_height+(row_height-text_box[3])/2), column, font=font_18,  fill=clr_black) 
         draw.line((axis_x_pos, row_height, axis_x_pos, img.size[1]), fill=clr_black) #vertical line before each column of the group
-        
-        for day in list(json_data[column])[1:]:
-            for time_id, time in enumerate(json_data[column][day]):
-                priority_subject = ""
-                priority_color = ""
-                for subject_id, subject in enumerate(json_data[column][day][time]): #priotities BLUE>BLACK>RED
-                    #subject_color = ImageColor.getcolor(json_data[column][day][time][subject]["state"], "RGB") #hex->rgb
-                    if("#0070C0" == json_data[column][day][time][subject]["state"]):
-                        priority_subject=subject
-                        priority_color = "#0070C0"
-                    elif("#000000" == json_data[column][day][time][subject]["state"] and priority_color != "#0070C0"):
-                        priority_subject=subject
-                        priority_color = "#000000"
-                    elif("#FF0000" == json_data[column][day][time][subject]["state"]) and priority_color != "#0070C0" and priority_color != "#000000":
-                        priority_subject=subject
-                        priority_color = "#FF0000"
-                priority_subject
-                if(len(priority_subject)):
-                    text_box = draw.textbbox((0, 0), priority_subject, font=font_18)
-                    draw.text((axis_x_pos + (column_width_px[column_id]-text_box[2])/2, axis_y_pos+(row_height-text_box[3])/2), priority_subject, font=font_18,  fill=priority_color) 
-                    if(priority_color=="#FF0000"):
-                        draw.line((axis_x_pos + (column_width_px[column_id]-text_box[2])/2,  axis_y_pos + row_height/2, axis_x_pos + (column_width_px[column_id]-text_box[2])/2 + text_box[2], axis_y_pos + row_height/2), width=2, fill=clr_red) #vertical line before each column of "group"
-                axis_y_pos = axis_y_pos + row_height
-        axis_x_pos = axis_x_pos + column_width_px[column_id]
-    img.save("./res/pics/"+file_name+".png")
+    return img
+
+
+def _draw_header(draw, width, week_start=None):
+    """
+    Draws header with dates of week, like "Розклад (2022.04.11 - 2022.04.17)", on picture of `width`.
+    """
+    dates = get_dates(week_start)
+    start_week = dates[1]
+    end_week = dates[2]
+    header_rozklad_date_range_text="Розклад ("+str(start_week).split(' ')[0].replace('-','.')+" - "+ str(end_week).split(' ')[0].replace('-','.')+")"   #text like - "Розклад (2022.04.11 - 2022.04.17)"
+    #print(header_rozklad_date_range_text) #keypoint debug
+    text_box = text_bbox(header_rozklad_date_range_text, font_21)
+    draw.text(((width-text_box[2])/2, (row_height-text_box[3])/2), header_rozklad_date_range_text, font=font_21,  fill=clr_white) 
+
+
+def resolve_slots(json_data, layout):
+    """
+    Picks subject drawn in every cell of `layout` (priorities of states BLUE>BLACK>RED, last one of the same priority,
+    see `state_styles`), so drawing does no comparisons of states.
+
+    Returns:
+        list: `(x, y, column width, subject, text color, strike line)` of non-empty cells.
+    """
+    slots = []
+    for column, axis_x_pos, column_width_px in layout.columns:
+        for day, time, axis_y_pos, is_first_in_day in layout.rows:
+            priority_subject = None
+            priority = len(state_styles)
+            for subject, lesson in json_data[column][day][time].items():
+                style = state_styles.get(lesson["state"])
+                if style and style[0] <= priority:
+                    priority_subject, priority, subject_style = subject, style[0], style
+            if priority_subject:
+                slots.append((axis_x_pos, axis_y_pos, column_width_px, priority_subject, subject_style[1], subject_style[2]))
+    return slots
+
+
+def _draw_subjects(draw, slots, layout):
+    """
+    Draws subjects of `resolve_slots` into cells of `layout` (one subject per cell).
+    """
+    for axis_x_pos, axis_y_pos, column_width_px, subject, color, strike in slots:
+        text_box = text_bbox(subject, font_18)
+        draw.text((axis_x_pos + (column_width_px-text_box[2])/2, axis_y_pos+(row_height-text_box[3])/2), subject, font=font_18,  fill=color) 
+        if strike:
+            draw.line((axis_x_pos + (column_width_px-text_box[2])/2,  axis_y_pos + row_height/2, axis_x_pos + (column_width_px-text_box[2])/2 + text_box[2], axis_y_pos + row_height/2), width=2, fill=clr_red) # strike line of cancelled lesson
+
+
+def render_pics(json_data, file_names, week_start=None, force=False, pic_preset="quality", conn=None):
+    """
+    Renders `json_data` via `draw_timetable` once and saves it under every name of `file_names`
+    (see `save_pic`), skipping names whose picture exists and was rendered from the same data
+    (fingerprint recorded in `renders` table of timetable store; `conn` - already opened store, it is left open).
+
+    Returns:
+        list: names of pictures that were (re-)rendered.
+    """
+    fingerprint = get_pic_fingerprint(json_data, week_start, pic_preset)
+    own_conn = conn is None
+    if own_conn:
+        conn = open_store()
+    try:
+        stale = [name for name in file_names if force or not os.path.exists(get_pic_path(name, pic_preset)) or
+                 conn.execute('SELECT fingerprint FROM renders WHERE name = ?', (name,)).fetchone() != (fingerprint,)]
+        count("pics_rendered", len(stale))
+        count("pics_skipped", len(file_names) - len(stale))
+        if stale:
+            img = draw_timetable(json_data, week_start, pic_presets[pic_preset]["mode"])
+            for name in stale:
+                save_pic(img, name, pic_preset)
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO renders (name, fingerprint) VALUES (?, ?)', [(name, fingerprint) for name in stale])
+    finally:
+        if own_conn:
+            conn.close()
+    return stale
+
+
+def render_weeks(weeks_data, force=False, pic_preset="quality", pages_name=None, conn=None):
+    """
+    Batch version of `render_pics` for several weeks of one file: pictures are drawn by `draw_timetables`
+    (same column widths for all weeks) and only weeks whose picture changed are drawn again.
+    With `pages_name`, all weeks are also saved as one multi-page `./res/pics/<pages_name>.pdf`, see `save_pages`.
+
+    Args:
+        weeks_data (dict): `{picture name: (json_data, week_start)}`, in order of pages
+        force (bool): render pictures even if their data didn't change
+        pic_preset (str): format / compression of pictures, one of `pic_presets`
+        pages_name (str): name of multi-page PDF, None - don't save it
+        conn (sqlite3.Connection): already opened store, it is left open
+
+    Returns:
+        list: names of pictures (and PDF) that were (re-)rendered.
+    """
+    with timed("layout"):
+        widths = get_shared_widths([json_data for json_data, week_start in weeks_data.values()])
+    fingerprints = {name: get_pic_fingerprint(json_data, week_start, pic_preset, widths) for name, (json_data, week_start) in weeks_data.items()}
+    own_conn = conn is None
+    if own_conn:
+        conn = open_store()
+    try:
+        stale = [name for name in weeks_data if force or not os.path.exists(get_pic_path(name, pic_preset)) or
+                 conn.execute('SELECT fingerprint FROM renders WHERE name = ?', (name,)).fetchone() != (fingerprints[name],)]
+        if pages_name:
+            fingerprints[pages_name] = hashlib.sha256(''.join(fingerprints[name] for name in weeks_data).encode()).hexdigest()
+            pages_stale = force or not os.path.exists("./res/pics/"+pages_name+".pdf") or \
+                conn.execute('SELECT fingerprint FROM renders WHERE name = ?', (pages_name,)).fetchone() != (fingerprints[pages_name],)
+        count("pics_rendered", len(stale))
+        count("pics_skipped", len(weeks_data) - len(stale))
+
+        to_draw = list(weeks_data) if pages_name and pages_stale else stale
+        images = draw_timetables({name: weeks_data[name] for name in to_draw}, pic_presets[pic_preset]["mode"], widths)
+        for name in stale:
+            save_pic(images[name], name, pic_preset)
+        if pages_name and pages_stale:
+            save_pages([images[name] for name in weeks_data], pages_name)
+            stale.append(pages_name)
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO renders (name, fingerprint) VALUES (?, ?)', [(name, fingerprints[name]) for name in stale])
+    finally:
+        if own_conn:
+            conn.close()
+    return stale
+
+
+def render_groups(json_data, name_suffix="", week_start=None, per_day=False, force=False, pic_preset="quality", conn=None):
+    """
+    Renders separate picture for each group of `json_data` as `./res/pics/groups/<group><name_suffix>.png`
+    and, with `per_day`, for each day of group as `.../<group><name_suffix>_<day>.png`.
+    Only pictures whose group (day) schedule changed since last render are drawn again, see `render_pics`
+    (all of them use the same store connection, `conn` or opened here).
+
+    Returns:
+        list: names of pictures that were (re-)rendered.
+    """
+    os.makedirs("./res/pics/groups", exist_ok=True)
+    rendered = []
+    own_conn = conn is None
+    if own_conn:
+        conn = open_store()
+    try:
+        for column in json_data:
+            group_names = ["groups/"+group.replace('/', '_')+name_suffix for group in json_data[column]["groups"] or [column]]
+            rendered.extend(render_pics({column: json_data[column]}, group_names, week_start, force, pic_preset, conn))
+            if per_day:
+                for day in list(json_data[column])[1:]:
+                    day_data = {column: {"groups": json_data[column]["groups"], day: json_data[column][day]}}
+                    rendered.extend(render_pics(day_data, [name+"_"+day.strip() for name in group_names], week_start, force, pic_preset, conn))
+    finally:
+        if own_conn:
+            conn.close()
+    return rendered
+
+
+def get_pic_fingerprint(json_data, week_start=None, pic_preset="quality", widths=None):
+    """
+    Returns hash of everything picture of `json_data` depends on: data itself, week in header, render settings
+    (and shared `widths` of columns, when picture is drawn with other weeks, see `render_weeks`).
+    """
+    week = get_dates(week_start)[1].strftime('%Y-%m-%d')
+    fingerprint_data = [json_data, week, get_render_settings_hash(pic_preset=pic_preset)]
+    if widths:
+        fingerprint_data.append(widths)
+    return hashlib.sha256(json.dumps(fingerprint_data, ensure_ascii=False).encode()).hexdigest()
 
 
 def fetch_schedule_data(table, file_name):
     """
-    Converts schedule table (partial XML of docx content) into structured JSON format.
+    Converts schedule table (parsed from XML of docx content) into structured JSON format.
     
     Arguments:
-    - table (str): partial XML representing timetable.
+    - table (Table): parsed table representing timetable.
     - file_name (str): The name of file where schedule data is being saved
 
     Returns:
     - json_data (dict): A nested dictionary representing the schedule.
 
     """
-    column_headers = get_column_headers(table, file_name)
-    #print(column_headers)
-    json_data = init_json(file_name, column_headers)
+    with timed("headers"):
+        column_headers = get_column_headers(table, file_name)
+        #print(column_headers)
+        json_data = init_json(file_name, column_headers)
+
+    with timed("cleaning"):
+        subject_texts = [cell_p.text for row in table.rows[1:] for cell in row.cells[2:2+len(column_headers)] for cell_p in cell.paragraphs]
+        cleaned_subjects = dict(zip(subject_texts, str_cleaner(list(subject_texts)))) # clean whole table in one batch
 
+    with timed("rows"): # includes "abbreviation"
+        _fill_schedule_data(json_data, table, column_headers, cleaned_subjects)
+    return json_data
+
+
+def _fill_schedule_data(json_data, table, column_headers, cleaned_subjects):
+    """
+    Fills `json_data` from `init_json` with lessons of table rows, see `fetch_schedule_data`.
+    """
     day=""
     time=""
-    rows = re.findall(r'<w:tr .*?>(.+?)</w:tr>', table)
-    for row in rows[1:]: #row id from 0... \ [1:] - coz 1st row - headers
-        cells = re.findall(r'<w:tc>(.+?)</w:tc>', row)
-        for cell_id, cell in enumerate(cells):
+    for row in table.rows[1:]: #row id from 0... \ [1:] - coz 1st row - headers
+        for cell_id, cell in enumerate(row.cells):
             if(cell_id > 2+len(column_headers)): #day+time+N columns
                 break                            # break if out of expercted len
             else:
                 cell_text=""
-                cell_paragraphs = re.findall(r'<w:p .*?>(.+?)</w:p>', cell)
-                for cell_p in cell_paragraphs:
-                    p_text = re.findall(r'(?:<w:t>(.+?)</w:t>)|(?:<w:t .*?>(.+?)</w:t>)', cell_p)
-                    p_text = ''.join(list(itertools.chain(*p_text)))
+                for cell_p in cell.paragraphs:
+                    p_text = cell_p.text
                     cell_text=cell_text+p_text+" "
 
                     if(cell_id==0):
@@ -315,28 +1916,40 @@ def fetch_schedule_data(table, file_name):
                             json_data[column][day][time]={}
                     
                     elif(cell_id < 2+len(column_headers) and cell_id>1):
-                        p_colors = re.findall(r'(?:<w:color w:val="(.+?)"/>)', cell_p)
-                        subject =str_cleaner([p_text])[0]
+                        p_format = cell_p.format
+                        subject = cleaned_subjects[p_text]
                         #print( time +"|"+ subject) # keypoint debug
                         if(len(subject) and subject[0].isalpha()):
-                            subject = shorten_text(subject)
+                            with timed("abbreviation"):
+                                subject = shorten_text(subject)
                             
                             #print(subject)
-                            json_data[column_headers[cell_id-2]][day][time][subject]={}
-                            if("л." in p_text):
-                                json_data[column_headers[cell_id-2]][day][time][subject]["type"]="lecture"
-                            elif("пр." in p_text):
-                                json_data[column_headers[cell_id-2]][day][time][subject]["type"]="practice"
-                            else:
-                                json_data[column_headers[cell_id-2]][day][time][subject]["type"]="?"
-                            if("FF0000" in p_colors):
-                                json_data[column_headers[cell_id-2]][day][time][subject]["state"]="#FF0000"
-                            elif("0070C0" in p_colors):
-                                json_data[column_headers[cell_id-2]][day][time][subject]["state"]="#0070C0"
-                            else:
-                                json_data[column_headers[cell_id-2]][day][time][subject]["state"]="#000000"       
+                            json_data[column_headers[cell_id-2]][day][time][subject]={
+                                "type": classify_type(p_text),
+                                "state": classify_state(p_format),
+                            }
                     #print("["+p_text+"]")   
-    return json_data
+
+
+def classify_type(text):
+    """
+    Returns lesson type of paragraph `text` by `type_rules`.
+    """
+    for marker, lesson_type in type_rules:
+        if marker in text:
+            return lesson_type
+    return "?"
+
+
+@lru_cache(maxsize=64)
+def classify_state(paragraph_format):
+    """
+    Returns lesson state (color of lesson in picture) of paragraph with `RunFormat` flags `paragraph_format` by `state_rules`.
+    """
+    for rule_format, state in state_rules:
+        if paragraph_format & rule_format:
+            return state
+    return "#000000"
 
 
 def init_json(file_name, column_headers):
@@ -344,96 +1957,182 @@ def init_json(file_name, column_headers):
     Initializes JSON structure for storing schedule data, based on column headers and the given file name.
     """
     json_data={}
-    known_columns=[]
     for column_name in column_headers:
-        complete_group_names=[]
-        known_columns.append(column_name)
+        groups, problems = resolve_column(column_name, file_name)
         json_data[column_name]={}
-        for temp in column_name.split(','):
-            #print("["+temp+"]") #keypoint debug
-            if(re.match("^[А-ЩЬЮЯҐЄІЇа-щьюяґєії]{1,}-\d{1,}$", temp)):
-                complete_group_names.append(temp)
-            else:
-                if(re.match("^[А-ЩЬЮЯҐЄІЇа-щьюяґєії]{1,}", temp)):
-                    matches = re.findall("\d{1,}", file_name )
-                    complete_group_names.append(temp+"-"+matches[0])
-                elif(re.match("\d{1,}", temp)):
-                    matches = re.findall("[А-ЩЬЮЯҐЄІЇа-щьюяґєії]{1,}", file_name )
-                    complete_group_names.append(matches[0]+"-"+temp)
-        json_data[column_name]["groups"]=complete_group_names
+        json_data[column_name]["groups"]=list(groups)
+        headers_report[column_name] = {"groups": list(groups), "problems": [list(problem) for problem in problems]}
     return json_data
 
 
+@lru_cache(maxsize=4096)
+def resolve_column(column_name, file_name):
+    """
+    Resolves column header (like "І-01,І-02", "ФР-92,93", "Ік", or file name for single group files)
+    into canonical group ids "<letters>-<number>" (Latin lookalike letters replaced by Cyrillic, see `canonical_group`).
+    Missing number / letters of group are taken from previous group of header or from file name (see `parse_file_name`).
+
+    Returns:
+        tuple: (tuple of group ids, tuple of problems `(fragment, "unresolved" / "ambiguous")`)
+    """
+    groups = []
+    problems = []
+    letters = None
+    for fragment in column_name.replace(' ', ',').split(','):
+        if not fragment:
+            continue
+        group = canonical_group(fragment)
+        if group:
+            letters = group.split('-')[0]
+        elif group_letters_re.match(fragment.translate(latin_lookalikes)):
+            file_letters, file_numbers = parse_file_name(file_name)
+            if not file_numbers:
+                problems.append((fragment, "unresolved"))
+                continue
+            if len(file_numbers) > 1:
+                problems.append((fragment, "ambiguous"))
+            letters = fragment.translate(latin_lookalikes)
+            group = letters+"-"+file_numbers[0]
+        elif group_number_re.match(fragment):
+            file_letters, file_numbers = parse_file_name(file_name)
+            if not letters:
+                if not file_letters:
+                    problems.append((fragment, "unresolved"))
+                    continue
+                if len(file_letters) > 1:
+                    problems.append((fragment, "ambiguous"))
+                letters = file_letters[0]
+            group = letters+"-"+fragment
+        else:
+            problems.append((fragment, "unresolved"))
+            continue
+        if group not in groups:
+            groups.append(group)
+    if not groups and not problems:
+        problems.append((column_name, "unresolved"))
+    return tuple(groups), tuple(problems)
+
+
+@lru_cache(maxsize=4096)
+def canonical_group(text):
+    """
+    Returns canonical id "<letters>-<number>" of group written like "К-91", "І21", "Cк31" (Latin C), or None if `text` is not a group.
+    """
+    match = group_re.match(text.replace(' ', '').translate(latin_lookalikes))
+    if not match:
+        return None
+    return match.group(1)+"-"+match.group(2)
+
+
+@lru_cache(maxsize=1024)
+def parse_file_name(file_name):
+    """
+    Returns distinct group letters and numbers used in file name, e.g. "ФСк-1112" -> (("ФСк",), ("11", "12")).
+    Numbers of several groups written together are split by 2 digits.
+    """
+    letters = []
+    for match in file_letters_re.findall(file_name.translate(latin_lookalikes)):
+        if match not in letters:
+            letters.append(match)
+    numbers = []
+    for match in file_numbers_re.findall(file_name):
+        for number in ([match[i:i+2] for i in range(0, len(match), 2)] if len(match) % 2 == 0 else [match]):
+            if number not in numbers:
+                numbers.append(number)
+    return tuple(letters), tuple(numbers)
+
+
+def load_cleaning_rules(path):
+    """
+    Loads and compiles text cleaning rules for `str_cleaner` from JSON file.
+    Each rule is `{"name", "pattern", "repl" (default ""), "if_matched": [rules]}`,
+    where `if_matched` rules are applied only if `pattern` matched anything.
+    Rules are applied in order, so new noise patterns are added by editing the file.
+
+    Returns:
+        list: list of `(compiled pattern, repl, [nested compiled rules])`.
+    """
+    with open(path, 'r', encoding="utf-8") as f:
+        rules = json.load(f)
+    return _compile_rules(rules)
+
+
+def _compile_rules(rules):
+    return [(re.compile(rule["pattern"]), rule.get("repl", ""), _compile_rules(rule.get("if_matched", []))) for rule in rules]
+
+
+def _apply_rules(text, rules):
+    count("regex_calls", len(rules))
+    for pattern, repl, if_matched in rules:
+        text, matched = pattern.subn(repl, text)
+        if matched and if_matched:
+            text = _apply_rules(text, if_matched)
+    return text
+
+
 def str_cleaner(list):
     """
-    Helper func, which cleans list of strings by removing unwanted words, characters, and formatting issues. 
+    Helper func, which cleans list of strings by removing unwanted words, characters, and formatting issues
+    (by `cleaning_rules`, one regex substitution per rule). Each distinct string is cleaned once,
+    so whole table can be cleaned in one call. 
     This includes:
     - Removing specific phrases such as "Google meet", "парний тиждень", etc.
     - Removing prefixes like "ст.", "викл.", and names of professors (FIO).
     - Removing numeric values, commas, and extra spaces.
     """
-
+    cleaned = {}
     for e_id, element in enumerate(list):
-        list[e_id] = list[e_id].replace("Google meet", "")
-        list[e_id] = list[e_id].replace("Google Meet", "")
-        list[e_id] = list[e_id].replace("Google class", "")
-        list[e_id] = list[e_id].replace("Google сlass", "")
-
-        even_day = re.findall(r'парний тиждень|парний тижд.|непарний тиждень|непарний тижд.', list[e_id])
-        for e in even_day:
-            list[e_id] = list[e_id].replace(e, '')
-            list[e_id] = list[e_id].replace("-", ' ')
-            list[e_id] = list[e_id].replace("–", ' ')
-
-        surnames = re.findall(r'([А-ЩЬЮЯҐЄІЇ][а-щьюяґєії\'’]+\.*?,?\s?[А-ЩЬЮЯҐЄІЇа]+\.[А-ЩЬЮЯҐЄІЇ]+\.?)', list[e_id]) #throw out full names of the teachers
-        for surname in surnames:
-            list[e_id] = list[e_id].replace(surname, '')
-
-        prefixs = re.findall(r'ст\.+ ?викл\.+|ст\.+вик\.+|пр\.+,?|доц\.+,?|викл\.+|проф\.+|доц |ст\.+| л\.+| л,|викл |лр.', list[e_id]) 
-        for p in prefixs:
-            list[e_id] = list[e_id].replace(p, '')
-
-        digits = re.findall(r'\d+\/\d+|\d+\.\d+', list[e_id]) 
-        for d in digits:
-            list[e_id] = list[e_id].replace(d, '')
-        list[e_id] = list[e_id].replace(",", '')
-
-        space_s = re.findall(r'\s\s+', list[e_id]) 
-        for s in space_s:
-            list[e_id] = list[e_id].replace(s, ' ')
-        list[e_id] = list[e_id].strip()
+        if element not in cleaned:
+            cleaned[element] = _apply_rules(element, cleaning_rules).strip()
+        list[e_id] = cleaned[element]
+    count("clean_cache_hits", len(list) - len(cleaned))
+    count("clean_cache_misses", len(cleaned))
     return list 
 
 
+def load_abbreviations(path):
+    """
+    Loads `{full subject name: abbreviation}` dictionary for `shorten_text` from JSON file.
+    """
+    with open(path, 'r', encoding="utf-8") as f:
+        return json.load(f)
+
+
+def normalize_subject(subject):
+    """
+    Lowercases subject and collapses whitespace, to catch trivial spelling differences without fuzzy matching.
+    """
+    return ' '.join(subject.lower().split())
+
+
+@lru_cache(maxsize=4096)
 def shorten_text(subject):
-    dict =	{
-    "Веб-орієнтована розробка програмного забезпечення": "Веб-орієнтована розробка",
-    "Іноземна мова (за спрямуванням)": "Іноземна мова",
-    "Іноземна мова (за фаховим спрямуванням)": "Іноземна мова",
-    "Іноземна мова (за професійним спрямуванням)": "Іноземна мова",
-    "Конструювання програмного забезпечення": "Конструювання ПЗ",
-    "Основи програмування та алгоритмічні мови": "Основи програмування та алг.",
-    "Інноваційне підприємництво та управління стартап проєктами (з гр.ФНМПІ-91)": "Підприємництво та стартапи",
-    "Архітектура та проектування програмного забезпечення": "Архітектура та проектування ПЗ",
-    "Бухгалтерський облік і звітність у ком.банках" : "Бух. облік і звітність",
-    "Математика (Алгебра і початки аналізу та геометрія)" : "Математика (алгебра та геометрія)",
-    "Математика (алгебра та геометрія)" : "Математика (алгебра та геометрія)",
-    "Загальна теорія здоров'я діагностика і моніторинг стану здоров'я" : "Теорія здоров'я",
-    "Фізична терапія при захворюваннях та порушеннях опорно-рухового апарату" : "Фіз. терапія опорно-рухового апарату",
-    "Моделювання та аналіз програмного забезпечення":"Моделювання та аналіз ПЗ",
-    "Якість програмного забезпечення та тестування":"Якість ПЗ та тестування",
-    "Інформаційно-комунікаційні технології в менеджменті":"Комунікаційні технології",
-    "Долікарська медична допомога у невідкладних станах":"Долікарська медична допомога",
-    "Безпека інформаційних систем/Безпека програм та даних":"Безпека програм та БД",
-    "Рекреаційна рухова активність та оздоровчий фітнес":"Оздоровчий фітнес",
-    "Теорія оздоровчого харчування дієтотерапія":"Оздорове харчування",
-    "Історія економіки та економічної думки (з гр.МТ-11)":"Історія економіки"
-    }
-    matches = sorted(dict, key=lambda x: SequenceMatcher(None, x, subject).ratio(), reverse=True)
-    if(round (SequenceMatcher(None, matches[0], subject).ratio(),2)>0.75):
-        return dict[matches[0]]
-    else:
-        return subject
+    """
+    Returns abbreviation of `subject` from `abbreviations`, or `subject` itself if there is no similar enough entry.
+    Looks up exact / normalized name first. Otherwise fuzzy matches (`SequenceMatcher` ratio > 0.75)
+    only entries whose length and character set upper bounds of ratio can pass the threshold.
+    Results are cached, since the same subjects repeat across all cells and files.
+    """
+    if subject in abbreviations:
+        return abbreviations[subject]
+    normalized = normalize_subject(subject)
+    if normalized in abbreviations_normalized:
+        return abbreviations_normalized[normalized]
+
+    best_ratio = 0
+    best_match = None
+    matcher = SequenceMatcher(None, b=subject) # `b` is analyzed once for all entries
+    for full_name in abbreviations:
+        matcher.set_seq1(full_name)
+        if matcher.real_quick_ratio() <= 0.75 or matcher.quick_ratio() <= 0.75: # upper bounds of ratio()
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best_ratio = ratio
+            best_match = full_name
+    if best_match is not None and round(best_ratio, 2) > 0.75:
+        return abbreviations[best_match]
+    return subject
 
 
 def get_column_headers(table, file_name):
@@ -442,78 +2141,246 @@ def get_column_headers(table, file_name):
     Skips the first two columns (Day and Time), processes remaining columns.
     
     Args:
-    - table (str): XML structure 
+    - table (Table): parsed table
     - file_name (str)
 
     Returns:
     - list: A list of column headers extracted from the table.
     """
     column_headers=[]
-    rows = re.findall(r'<w:tr .*?>(.+?)</w:tr>', table)
-    for  row in rows:
-        cells = re.findall(r'<w:tc>(.+?)</w:tc>', row)
-        for cell in cells[2:]: # [2:] skip День,Час
-            cell_paragraphs = re.findall(r'<w:p .*?>(.+?)</w:p>', cell)
-            for cell_p in cell_paragraphs:
-                p_text = re.findall(r'(?:<w:t>(.+?)</w:t>)|(?:<w:t .*?>(.+?)</w:t>)', cell_p)
-                p_text = ''.join(list(itertools.chain(*p_text)))
+    for  row in table.rows:
+        for cell in row.cells[2:]: # [2:] skip День,Час
+            for cell_p in cell.paragraphs:
+                p_text = cell_p.text
                 #print(p_text) #keypoint debug
-                if(SequenceMatcher(None, "Дисципліна", p_text).ratio()>0.75): #if Дисципліна" = group only one
+                if(is_discipline_header(p_text)): #if Дисципліна" = group only one
                     column_headers.append(file_name)
                     return column_headers
                 else:
-                    column_headers.append(re.sub(r'\([^)]*\)', '', p_text).replace(" ", "")) #removes "(123 students)"
+                    column_headers.append(students_count_re.sub('', p_text).replace(" ", "")) #removes "(123 students)"
         return column_headers
 
 
-def get_tabel(file):
+@lru_cache(maxsize=4096)
+def is_discipline_header(p_text):
+    """
+    Checks whether column header is "Дисципліна" (with typos), which means that file has one group only.
+    Cached, since the same headers repeat in every table.
+    """
+    return SequenceMatcher(None, "Дисципліна", p_text).ratio()>0.75
+
+
+def parse_document(stream):
+    """
+    Parses `word/document.xml` in single pass (iterparse over stream) into list of tables, see `iter_tables`.
+
+    Args:
+    - stream (file-like): opened `word/document.xml`, e.g. `zip.open('word/document.xml')`
+
+    Returns:
+    - list: list of `Table` in document order.
+    """
+    return list(iter_tables(stream))
+
+
+def iter_tables(stream):
+    """
+    Yields tables of `word/document.xml` one by one while it is read (and decompressed) in chunks from `stream`.
+    Each `<w:tr>` is converted into `Row` as soon as it is closed and then cleared, and every processed child
+    of `<w:body>` (tables, paragraphs between them) is removed from tree, so XML tree of at most one row
+    is held in memory. Nested tables are yielded as separate tables (before outer one).
+    """
+    rows = [] # rows of all open (nested) tables
+    depth = 0
+    body = None
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            depth = depth + 1
+            if elem.tag == w_body:
+                body = elem
+            continue
+        depth = depth - 1
+        if elem.tag == w_tr:
+            rows.append(_parse_row(elem))
+            elem.clear() # drop already parsed subtree
+        elif elem.tag == w_tbl:
+            rows_count = sum(1 for tr in elem.iterfind(w_tr))
+            table = Table(tuple(rows[len(rows)-rows_count:]))
+            del rows[len(rows)-rows_count:]
+            elem.clear()
+            yield table
+        if depth == 2 and body is not None: # processed child of `<w:body>`
+            elem.clear()
+            body.remove(elem)
+
+
+def parse_weeks(stream, weeks, reference=None):
+    """
+    Memory-bounded version of `get_week_index(parse_document(stream), reference)` for requested `weeks` only.
+    XML is decompressed and parsed in chunks while reading `stream` (see `iter_tables`), every table is checked
+    for dates right after it is closed and dropped unless it is the last table of requested week,
+    so apart from parser buffers at most one table per requested week (plus the current one) is held in memory.
+
+    Args:
+    - stream (file-like): opened `word/document.xml`, e.g. `zip.open('word/document.xml')`
+    - weeks (iterable): week starts (Mondays, datetime) to find
+    - reference (datetime): date used to guess year of dates written without year (today by default)
+
+    Returns:
+    - dict: week start -> `Table`, for requested weeks found in document.
+    """
+    reference = reference or get_dates()[0]
+    weeks = set(weeks)
+    week_index = {}
+    for table in iter_tables(stream):
+        count("tables")
+        with timed("table_lookup"):
+            for week_start in get_table_weeks(table, reference) & weeks:
+                week_index[week_start] = table # week belongs to the last table having its dates
+    return week_index
+
+
+def _parse_row(tr):
+    """
+    Converts `<w:tr>` element into `Row`.
+    """
+    cells = []
+    for tc in tr.iterfind(w_tc):
+        paragraphs = []
+        for p in tc.iter(w_p):
+            if len(p): # skip empty `<w:p/>`
+                runs = tuple(_parse_run(r) for r in p.iter(w_r))
+                paragraphs.append(Paragraph(runs, _get_format(p.find(w_ppr_rpr))))
+        cells.append(Cell(tuple(paragraphs)))
+    return Row(tuple(cells))
+
+
+def _parse_run(r):
+    """
+    Converts `<w:r>` element into `Run`.
+    """
+    return Run(''.join(t.text or '' for t in r.iterfind(w_t)), _get_format(r.find(w_rpr)))
+
+
+def _get_format(rpr):
+    """
+    Converts run properties `<w:rPr>` (or None) into `RunFormat` flags.
+    """
+    run_format = RunFormat.NONE
+    if rpr is None:
+        return run_format
+    for prop in rpr:
+        if prop.tag == w_color:
+            run_format |= format_colors.get(prop.get(w_val), RunFormat.NONE)
+        elif prop.tag in (w_strike, w_dstrike):
+            if prop.get(w_val) not in ("0", "false", "off"):
+                run_format |= RunFormat.STRIKE
+        elif prop.tag == w_highlight:
+            if prop.get(w_val) != "none":
+                run_format |= RunFormat.HIGHLIGHT
+    return run_format
+
+
+def get_tabel(tables):
+    """
+    Fetches table with schedule from parsed document (list of `Table`), which coresponds THIS date.
+    """
+    dates = get_dates()
+    return get_week_index(tables, dates[0]).get(dates[1], 0)
+
+
+def get_week_index(tables, reference=None):
     """
-    Fetches XML table with schedule from provided file, which coresponds THIS date.
+    Builds index of all weeks in parsed document: `{week start (Monday, datetime): Table}`.
+    Week belongs to the last table having any row date within it.
+
+    Args:
+    - tables (list): parsed document, list of `Table`
+    - reference (datetime): date used to guess year of dates written without year (today by default)
+
+    Returns:
+    - dict: week start -> `Table`
     """
-    dates = get_dates() 
-    tables = re.findall(r'<w:tbl>(.+?)</w:tbl>', file.decode('utf-8'))
+    reference = reference or get_dates()[0]
+    week_index = {}
     for table in reversed(tables):                # start from last table
-        rows = re.findall(r'<w:tr .*?>(.+?)</w:tr>', table)
-        for row in rows[1:]:
-            cells = re.findall(r'<w:tc>(.+?)</w:tc>', row)
-            for cell in cells:
-                cell_paragraphs = re.findall(r'<w:p .*?>(.+?)</w:p>', cell)
-                for cell_p in cell_paragraphs:
-                    p_text = re.findall(r'(?:<w:t>(.+?)</w:t>)|(?:<w:t .*?>(.+?)</w:t>)', cell_p)
-                    p_text = ''.join(list(itertools.chain(*p_text)))
-                    #print("["+p_text+"]")
-                    
-                    date_of_this_row=datetime(1, 1, 1) 
-                    try: 
-                        if(re.match("\d{2}.\d{2}.\d{2}", p_text)):
-                            date_of_this_row = datetime.strptime(p_text, '%d.%m.%yр.')
-                        elif(re.match(".\d{2}.\d{2}.\d{2}", p_text)):
-                            date_of_this_row = datetime.strptime(p_text, '.%d.%m.%yр.')
-                        elif(re.match("\d{2}.\d{2}.", p_text)):
-                            date_of_this_row = datetime.strptime(p_text, '%d.%m.')
-                            date_of_this_row = date_of_this_row.replace(year=dates[0].year)
-                        elif(re.match("\d{2}.\d{2}", p_text)):
-                            date_of_this_row = datetime.strptime(p_text, '%d.%m')
-                            date_of_this_row = date_of_this_row.replace(year=dates[0].year)
-                        if (date_of_this_row >=dates[1] and date_of_this_row <= dates[2]):    
-                            #print(str(date_of_this_row).split(' ')[0])
-                            #print("ok")
-                            return table
-                    except:
-                        pass
-    return 0   
+        for week_start in get_table_weeks(table, reference):
+            week_index.setdefault(week_start, table)
+    return week_index
 
 
-def get_dates(): 
+def get_table_weeks(table, reference):
     """
-    Returns the current date and the start and end dates of the current or next week.
+    Returns set of week starts (Mondays) of all row dates in `table`, see `parse_row_date`.
+    """
+    weeks = set()
+    for row in table.rows[1:]:
+        for cell in row.cells:
+            for cell_p in cell.paragraphs:
+                date_of_this_row = parse_row_date(cell_p.text, reference)
+                if date_of_this_row:
+                    weeks.add(date_of_this_row - timedelta(days=date_of_this_row.weekday()))
+    return weeks
+
+
+def parse_row_date(p_text, reference):
+    """
+    Parses date of timetable row like "12.09.22р.", ".12.09.22р.", "12.09." or "12.09".
+    Year of dates without year is taken closest to `reference`.
+
+    Returns:
+    - datetime: parsed date, or None if `p_text` is not a date.
+    """
+    try: 
+        if(date_full_re.match(p_text)):
+            return datetime.strptime(p_text, '%d.%m.%yр.')
+        elif(date_dot_full_re.match(p_text)):
+            return datetime.strptime(p_text, '.%d.%m.%yр.')
+        elif(date_short_dot_re.match(p_text)):
+            date_of_this_row = datetime.strptime(p_text, '%d.%m.')
+        elif(date_short_re.match(p_text)):
+            date_of_this_row = datetime.strptime(p_text, '%d.%m')
+        else:
+            return None
+        date_of_this_row = date_of_this_row.replace(year=reference.year)
+        if date_of_this_row - reference > timedelta(days=183):
+            date_of_this_row = date_of_this_row.replace(year=reference.year-1)
+        elif reference - date_of_this_row > timedelta(days=183):
+            date_of_this_row = date_of_this_row.replace(year=reference.year+1)
+        return date_of_this_row
+    except ValueError:
+        return None
+
+
+def get_weeks(first_day, last_day):
+    """
+    Returns start dates (Mondays) of all weeks from week containing `first_day` to week containing `last_day`.
+    """
+    week_start = first_day - timedelta(days=first_day.weekday())
+    weeks = []
+    while week_start <= last_day:
+        weeks.append(week_start)
+        week_start = week_start + timedelta(days=7)
+    return weeks
+
+
+def get_dates(today=None): 
+    """
+    Returns the current date (or `today`) and the start and end dates of the current or next week.
     """
     #today=datetime(2022, 4, 12)      
-    today = datetime(date.today().year, date.today().month, date.today().day)
+    today = today or datetime(date.today().year, date.today().month, date.today().day)
     if(today.weekday()<=4): # if Mon-Fri print this week
         start_week=today - timedelta(days=today.weekday())
         end_week=start_week + timedelta(days=6, hours=23, minutes=59)
     else: #else print next week
         start_week=today + timedelta(days=(7-today.weekday()))
         end_week=start_week + timedelta(days=6, hours=23, minutes=59)
-    return [today, start_week, end_week]
\ No newline at end of file
+    return [today, start_week, end_week]
+
+
+cleaning_rules = load_cleaning_rules(cleaning_rules_path) # compiled once at import
+cleaning_rules_hash = file_hash(cleaning_rules_path) # see `get_parse_rules_hash`
+abbreviations = load_abbreviations(abbreviations_path)
+abbreviations_hash = file_hash(abbreviations_path) # see `get_parse_rules_hash`
+abbreviations_normalized = {normalize_subject(full_name): abbreviations[full_name] for full_name in abbreviations}